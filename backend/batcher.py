@@ -0,0 +1,115 @@
+import asyncio
+import time
+from catalog import filters_key
+from rerank import rerank_key
+from timing import merge_timings
+
+class MicroBatcher:
+    """
+    Collects concurrent search requests into small batches.
+
+    Requests wait at most `max_wait_ms` (or until `max_batch_size` are queued),
+    then the whole batch is encoded and scored with `engine.search_many_hits`
+    in a worker thread, so the event loop stays free while the model runs.
+    Each request gets its SearchHits.
+
+    A request's `timings` dict (see timing.py) receives its wait in the queue
+    under "queue" plus the stage seconds of the search call it was served by,
+    which it shares with the other requests in that call.
+    """
+    def __init__(self, engine, max_batch_size=32, max_wait_ms=5.0):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.requests = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def search(self, query, limit=10, filters=None, rerank=None, timings=None, model=None):
+        future = asyncio.get_running_loop().create_future()
+        if timings is not None:
+            # Completed to the wait in the queue when the batch starts
+            timings["queue"] = -time.perf_counter()
+        await self._queue.put((query, limit, filters, rerank, model, timings, future))
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _search_batch(self, batch):
+        # search_many_hits takes one limit, filter set, rerank options and model, so group requests that share them
+        groups = {}
+        started = time.perf_counter()
+        for pos, (query, limit, filters, rerank, model, timings, _) in enumerate(batch):
+            groups.setdefault((limit, filters_key(filters), rerank_key(rerank), model), []).append(pos)
+            if timings is not None:
+                timings["queue"] += started
+
+        results = [None] * len(batch)
+        for positions in groups.values():
+            _, limit, filters, rerank, model, _, _ = batch[positions[0]]
+            timed = [batch[p][5] for p in positions if batch[p][5] is not None]
+            group_timings = {} if timed else None
+            found = self.engine.search_many_hits(
+                [batch[p][0] for p in positions], limit=limit, filters=filters, rerank=rerank,
+                timings=group_timings, model=model,
+            )
+            for pos, res in zip(positions, found):
+                results[pos] = res
+            for timings in timed:
+                merge_timings(timings, group_timings)
+        return results
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Drop requests whose callers already went away
+            batch = [req for req in batch if not req[-1].done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = await asyncio.to_thread(self._search_batch, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (*_, future), res in zip(batch, results):
+                if not future.done():
+                    future.set_result(res)
@@ -0,0 +1,51 @@
+import argparse
+import time
+import numpy as np
+from scoring import EMBEDDING_DTYPES, EmbeddingMatrix, normalize_rows, top_k
+
+# Micro-benchmark of the per-query scoring step (similarity + candidate selection)
+# on synthetic catalogs. The embedding model is not involved.
+
+CATALOG_SIZES = [377, 10_000, 100_000]
+DIM = 384
+POOL = 30
+
+def time_per_query(fn, queries, repeats):
+    fn(queries[0])  # warm-up
+    start = time.perf_counter()
+    for i in range(repeats):
+        fn(queries[i % len(queries)])
+    return (time.perf_counter() - start) / repeats * 1000
+
+def bench(sizes, repeats):
+    rng = np.random.default_rng(0)
+    queries = normalize_rows(rng.standard_normal((64, DIM)))
+
+    try:
+        from sklearn.metrics.pairwise import cosine_similarity
+    except ImportError:
+        cosine_similarity = None
+
+    print(f"{'items':>8} {'method':<26} {'ms/query':>10}")
+    for n in sizes:
+        raw = rng.standard_normal((n, DIM)).astype(np.float32)
+
+        if cosine_similarity is not None:
+            def legacy(q):
+                sims = cosine_similarity(q[None, :], raw)[0]
+                return np.argsort(sims)[::-1][:POOL]
+            print(f"{n:>8} {'sklearn cosine + argsort':<26} {time_per_query(legacy, queries, repeats):>10.3f}")
+
+        normalized = normalize_rows(raw)
+        for dtype in EMBEDDING_DTYPES:
+            matrix = EmbeddingMatrix(normalized, dtype)
+            def kernel(q, matrix=matrix):
+                return top_k(matrix.score(q), POOL)
+            print(f"{n:>8} {'gemv + argpartition ' + dtype:<26} {time_per_query(kernel, queries, repeats):>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-query scoring latency at several catalog sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=CATALOG_SIZES)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+    bench(args.sizes, args.repeats)
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+# Regression benchmarks for the recommend hot path: engine load (cold and
+# warm), single (plain and instrumented) and batched search, re-ranking and
+# /recommend through the in-process ASGI app. The stub encoder is used by
+# default, so the suite runs offline in seconds and measures our code rather
+# than the model.
+#
+# Each run is saved as data/bench/<commit>.json. With a saved baseline
+# (--save-baseline) the run fails when a case's median latency or peak
+# allocation grows beyond the tolerances below.
+
+LATENCY_TOLERANCE = float(os.environ.get("SHL_BENCH_LATENCY_TOLERANCE", "0.25"))
+MEMORY_TOLERANCE = float(os.environ.get("SHL_BENCH_MEMORY_TOLERANCE", "0.10"))
+# Absolute slack so sub-millisecond cases don't fail on timer noise
+LATENCY_SLACK_MS = 0.05
+MEMORY_SLACK_MB = 0.5
+
+QUERIES = [
+    "Java developer who can collaborate with business teams",
+    "Sales manager with strong communication skills",
+    "Entry level accounts payable clerk",
+    "Python, SQL and JavaScript developer",
+    "Customer service representative for a call centre",
+    "Senior data analyst with Excel and Tableau",
+    "Team lead for a software engineering group",
+    "Administrative assistant with MS Office skills",
+]
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+def measure(fn, repeats, warmup=1):
+    """Latency stats of `fn()` in ms, plus the peak traced allocation of one extra call."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = np.array(times)
+    return {
+        "repeats": repeats,
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "min_ms": float(times.min()),
+        "peak_alloc_mb": peak / 1024 / 1024,
+    }
+
+def run_suite(data_file, encoder, repeats):
+    import engine as E
+    from cache import LRUCache
+
+    cases = {}
+    cache_dir = tempfile.mkdtemp(prefix="shl-bench-")
+    original_paths = (E.DATA_FILE, E.CACHE_DIR)
+    E.DATA_FILE, E.CACHE_DIR = data_file, cache_dir
+    try:
+        def cold_load():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            E.RecommendationEngine(encoder_backend=encoder)
+        cases["load_cold"] = measure(cold_load, max(1, repeats // 10), warmup=0)
+        engine = E.RecommendationEngine(encoder_backend=encoder)
+        cases["load_warm"] = measure(lambda: E.RecommendationEngine(encoder_backend=encoder), max(1, repeats // 10))
+
+        # Uncached search: the caches would otherwise answer every repeat
+        engine.query_cache = LRUCache(0)
+        engine.result_cache = LRUCache(0)
+        engine.dedup_threshold = 0
+        queries = iter(QUERIES * (repeats + 2))
+        cases["search"] = measure(lambda: engine.search(next(queries)), repeats)
+        # Same with per-stage timings recorded into the /metrics histograms, as /recommend does;
+        # the difference to "search" is the instrumentation overhead
+        cases["search_timed"] = measure(lambda: timed_search(engine, next(queries)), repeats)
+        cases["search_many_64"] = measure(lambda: engine.search_many(QUERIES * 8), max(1, repeats // 10))
+
+        query = QUERIES[0]
+        indices, scores = engine.index.search(engine._encode([query])[0], E.CANDIDATE_POOL)
+        cases["rerank"] = measure(lambda: engine._rerank(engine.snapshot, indices, scores, query, 10), repeats)
+
+        cases["recommend_endpoint"] = recommend_case(E, engine, repeats)
+    finally:
+        E.DATA_FILE, E.CACHE_DIR = original_paths
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return cases
+
+def timed_search(engine, query):
+    import metrics
+    timings = {}
+    engine.search(query, timings=timings)
+    metrics.observe_stages(timings)
+
+def recommend_case(E, engine, repeats):
+    import httpx
+
+    E._engine = engine
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    queries = iter(QUERIES * (repeats + 2))
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                async def post():
+                    response = await client.post("/recommend", json={"query": next(queries)})
+                    response.raise_for_status()
+                loop = asyncio.get_running_loop()
+                # measure() is synchronous, so run it in a thread that submits to this loop
+                return await asyncio.to_thread(
+                    measure, lambda: asyncio.run_coroutine_threadsafe(post(), loop).result(), repeats
+                )
+
+    return asyncio.run(run())
+
+def compare(report, baseline):
+    """Failure messages for cases slower or larger than the baseline allows."""
+    failures = []
+    for name, case in report["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        limit = base["median_ms"] * (1 + LATENCY_TOLERANCE) + LATENCY_SLACK_MS
+        if case["median_ms"] > limit:
+            failures.append(f"{name}: median {case['median_ms']:.3f} ms > {limit:.3f} ms "
+                            f"(baseline {base['median_ms']:.3f} ms)")
+        limit = base["peak_alloc_mb"] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_MB
+        if case["peak_alloc_mb"] > limit:
+            failures.append(f"{name}: peak allocation {case['peak_alloc_mb']:.2f} MB > {limit:.2f} MB "
+                            f"(baseline {base['peak_alloc_mb']:.2f} MB)")
+    limit = baseline["peak_rss_mb"] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_MB
+    if report["peak_rss_mb"] > limit:
+        failures.append(f"peak RSS {report['peak_rss_mb']:.1f} MB > {limit:.1f} MB "
+                        f"(baseline {baseline['peak_rss_mb']:.1f} MB)")
+    return failures
+
+def print_report(report, baseline=None):
+    print(f"\nCommit {report['commit']}, encoder {report['encoder']}, {report['catalog_size']} assessments")
+    print(f"{'case':<20} {'median ms':>10} {'p95 ms':>9} {'alloc MB':>9} {'vs base':>8}")
+    for name, case in report["cases"].items():
+        base = (baseline or {}).get("cases", {}).get(name)
+        delta = f"{case['median_ms'] / base['median_ms'] - 1:+.0%}" if base and base["median_ms"] else "-"
+        print(f"{name:<20} {case['median_ms']:>10.3f} {case['p95_ms']:>9.3f} {case['peak_alloc_mb']:>9.2f} {delta:>8}")
+    print(f"peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+def main(args):
+    import engine as E
+
+    data_file = args.data or E.DATA_FILE
+    bench_dir = args.out or os.path.join(os.path.dirname(data_file), "bench")
+    os.makedirs(bench_dir, exist_ok=True)
+    baseline_path = os.path.join(bench_dir, "baseline.json")
+
+    cases = run_suite(data_file, args.encoder, args.repeats)
+    with open(data_file, "r", encoding="utf-8") as f:
+        catalog_size = len(json.load(f))
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "encoder": args.encoder,
+        "catalog_size": catalog_size,
+        "cases": cases,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    baseline = None
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    path = os.path.join(bench_dir, f"{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {path}")
+    if args.save_baseline:
+        shutil.copyfile(path, baseline_path)
+        print(f"Saved baseline {baseline_path}")
+        return 0
+
+    if baseline is None:
+        print("No baseline to compare against; run with --save-baseline to create one.")
+        return 0
+    if baseline.get("encoder") != report["encoder"] or baseline.get("catalog_size") != report["catalog_size"]:
+        print("Warning: baseline was recorded with a different encoder or catalog; not comparing.")
+        return 0
+    failures = compare(report, baseline)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if not failures:
+        print(f"OK against baseline {baseline['commit']}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recommend hot path and compare with a baseline")
+    parser.add_argument("--data", help="catalog JSON (default: engine.DATA_FILE)")
+    parser.add_argument("--encoder", default="stub", help="encoder backend (default: stub)")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--out", help="directory for results (default: data/bench)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    sys.exit(main(parser.parse_args()))
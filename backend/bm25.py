@@ -0,0 +1,80 @@
+import re
+from collections import Counter
+import numpy as np
+
+# Okapi BM25 over the same corpus strings the engine embeds. Postings are kept
+# CSR-style per term (`indptr` into `doc_ids`/`weights`), with the full BM25
+# term weight precomputed, so scoring a query is one scatter-add per term.
+
+# Keeps tokens like ".net", "c#", "c++" intact
+TOKEN_RE = re.compile(r"\.?[a-z0-9][a-z0-9+#]*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can for from has have i in is it its of on or our that the their this
+to was we were will with who you your which also they them he she not all any but into more
+""".split())
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    def __init__(self, corpus, k1=1.5, b=0.75):
+        self.n_docs = len(corpus)
+        self.vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.zeros(self.n_docs, dtype=np.float32)
+
+        for doc, text in enumerate(corpus):
+            counts = Counter(tokenize(text))
+            doc_len[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+
+        term_ids = np.array(term_ids, dtype=np.int32)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        tfs = np.array(tfs, dtype=np.float32)
+
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        df = np.bincount(term_ids, minlength=len(self.vocab)).astype(np.float32)
+
+        self.indptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self.doc_ids = doc_ids
+
+        avg_len = doc_len.mean() if self.n_docs else 0.0
+        idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * doc_len[doc_ids] / max(avg_len, 1e-9))
+        self.weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    @classmethod
+    def from_arrays(cls, vocab, indptr, doc_ids, weights, n_docs):
+        """Wrap existing postings (e.g. memory-mapped from a published snapshot) without copying."""
+        index = cls.__new__(cls)
+        index.n_docs = n_docs
+        index.vocab = vocab
+        index.indptr, index.doc_ids, index.weights = indptr, doc_ids, weights
+        return index
+
+    def score(self, query):
+        """BM25 score of every document for `query` (0 for documents without query terms)."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # Doc ids within one posting list are unique, so fancy-index += is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def top_k(self, query, k, mask=None):
+        """Indices of up to k best-matching documents (score > 0), best first."""
+        scores = self.score(query)
+        if mask is not None:
+            scores[~mask] = 0.0
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        return matched[np.argsort(-scores[matched], kind="stable")]
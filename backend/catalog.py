@@ -0,0 +1,137 @@
+import json
+import re
+import numpy as np
+
+# Columnar metadata parsed once per catalog load, so search filters are plain
+# boolean masks over NumPy arrays instead of per-item string checks, and search
+# and balancing work on row numbers without touching the record dicts.
+
+# SHL test type keys, one bit each in `type_mask`
+TEST_TYPE_KEYS = "ABCDEKPS"
+TEST_TYPE_BITS = {key: 1 << i for i, key in enumerate(TEST_TYPE_KEYS)}
+
+# Filter keys understood by CatalogColumns.mask
+FILTER_KEYS = ("max_duration", "min_duration", "test_types", "remote", "adaptive")
+
+def parse_duration(text):
+    """Minutes from strings like "30 minutes"; -1 when unknown ("N/A")."""
+    match = re.search(r"\d+", str(text or ""))
+    return int(match.group()) if match else -1
+
+def test_type_mask(text):
+    """Bitmask of the SHL keys in a comma-joined test_type string."""
+    mask = 0
+    for key in re.split(r"[,\s]+", str(text or "").upper()):
+        mask |= TEST_TYPE_BITS.get(key, 0)
+    return mask
+
+def response_fragment(item):
+    """/recommend JSON for one item up to its score: b'{"assessment_name": ..., "assessment_url": ..., "score": '."""
+    head = json.dumps({"assessment_name": item.get('assessment_name'), "assessment_url": item.get('assessment_url')},
+                      ensure_ascii=False)
+    return (head[:-1] + ', "score": ').encode("utf-8")
+
+class CatalogColumns:
+    """
+    Parallel arrays, one entry per catalog row: filterable metadata, the
+    Hard/Soft category used for balancing, and pre-serialized response
+    fragments so API responses are built only for the returned rows.
+    Expects records that already have their 'category' set.
+    """
+    def __init__(self, assessments):
+        self.duration = np.array([parse_duration(a.get('duration')) for a in assessments], dtype=np.int32)
+        self.type_mask = np.array([test_type_mask(a.get('test_type')) for a in assessments], dtype=np.uint8)
+        self.remote = np.array([a.get('remote_testing') == "Yes" for a in assessments], dtype=bool)
+        self.adaptive = np.array([a.get('adaptive_irt') == "Yes" for a in assessments], dtype=bool)
+        self.hard = np.array([a.get('category') == "Hard" for a in assessments], dtype=bool)
+        self.fragments = [response_fragment(a) for a in assessments]
+
+    @classmethod
+    def from_arrays(cls, duration, type_mask, remote, adaptive, hard, fragments):
+        """Wrap existing arrays (e.g. memory-mapped from a published snapshot) without copying."""
+        columns = cls.__new__(cls)
+        columns.duration, columns.type_mask = duration, type_mask
+        columns.remote, columns.adaptive = remote, adaptive
+        columns.hard, columns.fragments = hard, fragments
+        return columns
+
+    def __len__(self):
+        return len(self.duration)
+
+    def mask(self, filters):
+        """
+        Boolean array of rows satisfying `filters`, or None when nothing is filtered.
+        Items with unknown duration are kept by duration filters, since they may qualify.
+        """
+        if not filters:
+            return None
+
+        keep = np.ones(len(self), dtype=bool)
+        known = self.duration >= 0
+        if filters.get("max_duration") is not None:
+            keep &= ~known | (self.duration <= filters["max_duration"])
+        if filters.get("min_duration") is not None:
+            keep &= ~known | (self.duration >= filters["min_duration"])
+        if filters.get("test_types"):
+            bits = test_type_mask(",".join(filters["test_types"]))
+            keep &= (self.type_mask & bits) != 0
+        if filters.get("remote") is not None:
+            keep &= self.remote == bool(filters["remote"])
+        if filters.get("adaptive") is not None:
+            keep &= self.adaptive == bool(filters["adaptive"])
+        return keep
+
+_NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3}
+_UNIT = r"(?P<unit>hours?|hrs?|minutes?|mins?)\b"
+# Not preceded by a word character, digit or point, so "1.5 hours" is never read as 5
+_NUMBER = r"\d+(?:\.\d+)?"
+_VALUE = (r"(?<![\w.])(?P<low>" + _NUMBER + r"|an?|one|two|three)"
+          r"(?:\s*(?:-|to|and)\s*(?P<high>" + _NUMBER + r"))?")
+_DURATION_RE = re.compile(
+    r"(?P<qualifier>at\s*most|max(?:imum)?(?:\s+duration)?(?:\s+of)?|not\s+(?:be\s+)?more\s+than|no\s+more\s+than|"
+    r"less\s+than|under|within|up\s+to|at\s*least|minimum(?:\s+of)?|between)?\s*"
+    + _VALUE + r"\s*-?\s*" + _UNIT,
+    re.IGNORECASE,
+)
+_MIN_QUALIFIERS = ("atleast", "minimum")
+# In job descriptions and fetched pages most durations are about the job ("15 minutes
+# break", "respond within an hour"); there only sentences about the assessment count
+_ASSESSMENT_RE = re.compile(r"\b(?:asses+m\w*|assess\w*|tests?|exams?|quiz\w*|duration|time\s+limit)\b", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"[^.!?\n]+")
+
+def extract_filters(query, assessment_sentences_only=False):
+    """
+    Duration constraints stated in a query, e.g. "completed in 40 minutes" ->
+    {"max_duration": 40}, "at least 30 mins" -> {"min_duration": 30},
+    "1-2 hour long" -> {"max_duration": 120}, "between 20 and 40 minutes" ->
+    {"min_duration": 20, "max_duration": 40}. Returns {} when none are found.
+    With `assessment_sentences_only` (long texts), only sentences mentioning
+    the assessment or test are read.
+    """
+    text = query or ""
+    if assessment_sentences_only:
+        text = "\n".join(s for s in _SENTENCE_RE.findall(text) if _ASSESSMENT_RE.search(s))
+    filters = {}
+    for match in _DURATION_RE.finditer(text):
+        qualifier = re.sub(r"\s+", "", (match.group("qualifier") or "").lower())
+        low, high = match.group("low").lower(), match.group("high")
+        scale = 60 if match.group("unit").lower().startswith("h") else 1
+        low = round(float(_NUMBER_WORDS.get(low, low)) * scale)
+        if high is not None:
+            high = round(float(high) * scale)
+
+        if qualifier == "between" and high is not None:
+            filters["min_duration"], filters["max_duration"] = low, high
+        elif qualifier.startswith(_MIN_QUALIFIERS) and high is None:
+            filters["min_duration"] = low
+        else:
+            filters["max_duration"] = high if high is not None else low
+    return filters
+
+def filters_key(filters):
+    """Hashable form of a filters dict, for cache keys and grouping."""
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (k, tuple(v) if isinstance(v, (list, tuple)) else v) for k, v in filters.items() if v is not None
+    ))
@@ -0,0 +1,140 @@
+import os
+import re
+import time
+import numpy as np
+from cache import LRUCache
+
+# Optional second stage: the top of the candidate pool is re-scored with a
+# cross-encoder, which reads (query, assessment text) together and ranks far
+# better than cosine similarity, at the cost of one forward pass per pair.
+#
+# All pairs of a search call (one query, or a micro-batch of them) go through
+# the model in one batched pass. That pass is held to a latency budget: a
+# running estimate of the cost per pair decides how many candidates per query
+# fit, so under load (bigger batches) each query gets fewer, and when not even
+# MIN_PAIRS fit the stage is skipped. Pair scores are cached, and cached pairs
+# cost nothing against the budget.
+#
+# Re-scoring only reorders the top N; the reported `score` stays the cosine
+# similarity, which the Hard/Soft balance and clients compare on.
+
+CROSS_ENCODER_BACKENDS = ("torch", "stub")
+# Backend to load at startup ("" = stage disabled). Requests can still turn it
+# off with "cross_encoder": false in their rerank options.
+CROSS_ENCODER = os.environ.get("SHL_CROSS_ENCODER", "")
+CROSS_ENCODER_MODEL = os.environ.get("SHL_CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates re-scored per query, and the time the whole pass may take (ms, 0 = unlimited)
+CROSS_ENCODER_TOP_N = int(os.environ.get("SHL_CROSS_ENCODER_TOP_N", "20"))
+CROSS_ENCODER_BUDGET_MS = float(os.environ.get("SHL_CROSS_ENCODER_BUDGET_MS", "50"))
+PAIR_CACHE_SIZE = int(os.environ.get("SHL_PAIR_CACHE_SIZE", "65536"))
+# Re-scoring fewer candidates than this per query is not worth a pass (unless
+# the request asked for fewer)
+MIN_PAIRS = 4
+# Weight of the newest pass in the running cost-per-pair estimate
+COST_SMOOTHING = 0.2
+
+def load_cross_encoder(backend, model_name=CROSS_ENCODER_MODEL):
+    if backend not in CROSS_ENCODER_BACKENDS:
+        raise ValueError(f"Unknown cross-encoder backend {backend!r}, expected one of {CROSS_ENCODER_BACKENDS}")
+    if backend == "stub":
+        return StubCrossEncoder()
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name)
+
+class StubCrossEncoder:
+    """Share of query words found in the text; no model (benchmarks, offline runs)."""
+    WORD_RE = re.compile(r"[a-z0-9+#.]+")
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for i, (query, text) in enumerate(pairs):
+            words = set(self.WORD_RE.findall(query.lower()))
+            if words:
+                scores[i] = len(words & set(self.WORD_RE.findall(text.lower()))) / len(words)
+        return scores
+
+class CrossReranker:
+    """
+    Re-scores candidate pools with `model` (anything with a CrossEncoder-style
+    `predict(list[(query, text)]) -> scores`) within a latency budget.
+    """
+    def __init__(self, model, batch_size=64):
+        self.model = model
+        self.batch_size = batch_size
+        self.pair_cache = LRUCache(PAIR_CACHE_SIZE)
+        # Seconds per pair, learned from the passes so far (None until the first)
+        self.pair_seconds = None
+        self.passes = {"full": 0, "reduced": 0, "skipped": 0}
+
+    def stats(self):
+        return {
+            "pair_ms": self.pair_seconds * 1000 if self.pair_seconds else None,
+            "passes": dict(self.passes),
+            "pair_cache": self.pair_cache.stats(),
+        }
+
+    def plan(self, misses, top_n, budget_ms):
+        """
+        Candidates per query to re-score, given `misses[q][j]` (True when the
+        j-th candidate of query q has no cached score). Returns `top_n` when
+        everything fits the budget, less when not, 0 to skip.
+        """
+        if not budget_ms or budget_ms <= 0 or self.pair_seconds is None:
+            return top_n
+        affordable = budget_ms / 1000.0 / self.pair_seconds
+        for n in range(top_n, min(MIN_PAIRS, top_n) - 1, -1):
+            if sum(int(np.count_nonzero(m[:n])) for m in misses) <= affordable:
+                return n
+        return 0
+
+    def rescore(self, queries, pools, text, top_n=None, budget_ms=None):
+        """
+        Reorder the top of each candidate pool by cross-encoder score.
+        `pools` are (indices, scores) pairs, best first; `text(row)` gives the
+        assessment text for a catalog row. Returns (pools, complete), where
+        `complete` is False when the budget cut the stage short, so callers
+        can avoid caching a degraded ranking.
+        """
+        top_n = CROSS_ENCODER_TOP_N if top_n is None else int(top_n)
+        budget_ms = CROSS_ENCODER_BUDGET_MS if budget_ms is None else budget_ms
+
+        # Padding from filters sits at the end of a pool with -inf scores
+        sizes = [min(top_n, int(np.count_nonzero(np.isfinite(scores)))) for _, scores in pools]
+        keys = [
+            [(query, text(row)) for row in indices[:size].tolist()]
+            for query, (indices, _), size in zip(queries, pools, sizes)
+        ]
+        cached = [[self.pair_cache.get(key) for key in query_keys] for query_keys in keys]
+        misses = [np.array([score is None for score in query_scores], dtype=bool) for query_scores in cached]
+
+        n = self.plan(misses, top_n, budget_ms)
+        if n < min(MIN_PAIRS, top_n) or n == 0:
+            self.passes["skipped"] += 1
+            return pools, False
+        self.passes["full" if n >= top_n else "reduced"] += 1
+
+        todo = list(dict.fromkeys(
+            key for query_keys, query_misses in zip(keys, misses)
+            for key, miss in zip(query_keys[:n], query_misses[:n]) if miss
+        ))
+        if todo:
+            start = time.perf_counter()
+            scores = np.asarray(self.model.predict(todo, batch_size=self.batch_size), dtype=np.float32).reshape(len(todo))
+            seconds = (time.perf_counter() - start) / len(todo)
+            self.pair_seconds = seconds if self.pair_seconds is None else (
+                COST_SMOOTHING * seconds + (1 - COST_SMOOTHING) * self.pair_seconds
+            )
+            for key, score in zip(todo, scores.tolist()):
+                self.pair_cache.put(key, score)
+            fresh = dict(zip(todo, scores.tolist()))
+        else:
+            fresh = {}
+
+        out = []
+        for (indices, scores), query_keys, query_scores in zip(pools, keys, cached):
+            m = min(n, len(query_keys))
+            cross = np.array([s if s is not None else fresh[k] for k, s in zip(query_keys[:m], query_scores[:m])])
+            head = np.argsort(-cross, kind="stable")
+            order = np.concatenate([head, np.arange(m, len(indices))])
+            out.append((np.asarray(indices)[order], np.asarray(scores)[order]))
+        return out, n >= top_n
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+# On-disk vector store for catalog embeddings, one entry per (model, catalog
+# version, corpus template):
+#
+#   <model>-<key>.json         header: model id, dim, dtype, count, catalog version
+#                              (data_hash)
+#   <model>-<key>.npy          contiguous float32 matrix, one L2-normalized row per item
+#   <model>-<key>.ids.npy      fixed-width string column of assessment_url, row-aligned
+#   <model>-<key>.hashes.npy   text hash of each row, row-aligned
+#
+# The arrays are memory-mapped read-only, so opening an entry is O(1) and every
+# process serving the same catalog shares one copy. An entry whose ID column does
+# not match the catalog is rebuilt, and rows are reused by (URL, text hash) when
+# the catalog changes. Entries of different models live side by side; the engine
+# opens one per loaded model.
+
+# Bump when the on-disk layout or the meaning of the stored vectors changes.
+# 2: vectors are stored L2-normalized.
+CACHE_VERSION = 2
+
+def hash_text(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+def cache_key(model_name, data_hash, template):
+    """Key identifying one catalog encoding: model + catalog content + corpus template."""
+    raw = f"{CACHE_VERSION}|{model_name}|{data_hash}|{template}"
+    return hash_text(raw)[:16]
+
+def _safe_name(model_name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+
+def _entry_pattern(model_name):
+    """Matches files belonging to any cache entry of exactly this model."""
+    return re.compile(re.escape(_safe_name(model_name)) + r"-([0-9a-f]{16})\.")
+
+def _paths(cache_dir, model_name, key):
+    base = os.path.join(cache_dir, f"{_safe_name(model_name)}-{key}")
+    return base + ".npy", base + ".json"
+
+def _ids_path(npy_path):
+    return npy_path[:-len(".npy")] + ".ids.npy"
+
+def _hashes_path(npy_path):
+    return npy_path[:-len(".npy")] + ".hashes.npy"
+
+def artifact_path(cache_dir, model_name, data_hash, template, suffix):
+    """Path for a file derived from one cache entry (e.g. an ANN index); pruned with it."""
+    base = os.path.join(cache_dir, f"{_safe_name(model_name)}-{cache_key(model_name, data_hash, template)}")
+    return base + suffix
+
+def _read_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _load_column(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+def _row_keys(npy_path, manifest):
+    """
+    (ids, text hashes) of an entry's rows; ids is None without an ID column.
+    Entries from before the hash column keep the hashes in their header.
+    """
+    hashes = _load_column(_hashes_path(npy_path))
+    hashes = manifest.get("item_hashes", []) if hashes is None else [h.decode("ascii") for h in hashes.tolist()]
+    ids = _load_column(_ids_path(npy_path))
+    return (ids.tolist() if ids is not None and len(ids) == len(hashes) else None), hashes
+
+def _find_previous(cache_dir, model_name, template):
+    """Return ((ids, text hashes), matrix) of the newest compatible cache entry, if any."""
+    if not os.path.isdir(cache_dir):
+        return None, None
+
+    pattern = _entry_pattern(model_name)
+    candidates = []
+    for name in os.listdir(cache_dir):
+        if not (pattern.match(name) and name.endswith(".json")):
+            continue
+        path = os.path.join(cache_dir, name)
+        manifest = _read_manifest(path)
+        if not manifest:
+            continue
+        if manifest.get("version") != CACHE_VERSION or manifest.get("model_name") != model_name:
+            continue
+        if manifest.get("template") != template:
+            continue
+        candidates.append((os.path.getmtime(path), path, manifest))
+
+    for _, path, manifest in sorted(candidates, reverse=True):
+        npy_path = path[:-len(".json")] + ".npy"
+        try:
+            return _row_keys(npy_path, manifest), np.load(npy_path, mmap_mode="r")
+        except (OSError, ValueError):
+            continue
+    return None, None
+
+def _write(cache_dir, model_name, key, manifest, matrix, item_hashes, ids=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    npy_path, json_path = _paths(cache_dir, model_name, key)
+
+    # Write to temp files and rename so concurrent workers never see a partial file.
+    # The header goes last: an entry counts as present once its header is.
+    tmp_suffix = f".{os.getpid()}.tmp"
+    with open(npy_path + tmp_suffix, "wb") as f:
+        np.save(f, matrix)
+    os.replace(npy_path + tmp_suffix, npy_path)
+    _write_column(_hashes_path(npy_path), np.array(item_hashes, dtype="S40"))
+    if ids is not None:
+        _write_ids(npy_path, ids)
+    with open(json_path + tmp_suffix, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(json_path + tmp_suffix, json_path)
+
+def _write_column(path, column):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, column)
+    os.replace(tmp, path)
+
+def _write_ids(npy_path, ids):
+    # Fixed-width unicode so the column can be memory-mapped like the matrix
+    _write_column(_ids_path(npy_path), np.array([str(i) for i in ids], dtype=str))
+
+def open_store(cache_dir, model_name, data_hash, template):
+    """
+    (header, matrix, ids) of the entry for this model and catalog, memory-mapped
+    without reading the data, or None if there is none. `ids` is None for
+    entries written without an ID column.
+    """
+    npy_path, json_path = _paths(cache_dir, model_name, cache_key(model_name, data_hash, template))
+    header = _read_manifest(json_path)
+    if not header:
+        return None
+    try:
+        matrix = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if len(matrix) != header.get("count"):
+        return None
+    ids_path = _ids_path(npy_path)
+    ids = np.load(ids_path, mmap_mode="r") if os.path.exists(ids_path) else None
+    return header, matrix, ids
+
+def _prune(cache_dir, model_name, keep_key):
+    pattern = _entry_pattern(model_name)
+    for name in os.listdir(cache_dir):
+        match = pattern.match(name)
+        if match and match.group(1) != keep_key and not name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                # Another process may still have the old matrix mapped.
+                pass
+
+def load_embeddings(encode, texts, model_name, data_hash, template, cache_dir, ids=None):
+    """
+    Return the embedding matrix for `texts`, using the on-disk cache when possible.
+
+    On an exact key match the matrix is memory-mapped read-only, so several
+    workers share one copy through the page cache. Otherwise rows whose text is
+    unchanged are reused from the newest compatible entry and only the new or
+    edited texts are passed to `encode`. `ids` (one per text) are stored as the
+    entry's ID column; an exact-key entry whose column differs is rebuilt, and
+    with IDs on both sides rows are reused by (id, text hash).
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    ids = [str(i) for i in ids] if ids is not None else None
+    store = open_store(cache_dir, model_name, data_hash, template)
+    if store is not None and len(store[1]) == len(texts):
+        npy_path, _ = _paths(cache_dir, model_name, cache_key(model_name, data_hash, template))
+        if ids is None or store[2] is None or store[2].tolist() == ids:
+            if ids is not None and store[2] is None:
+                # Entry from before ID columns were stored
+                try:
+                    _write_ids(npy_path, ids)
+                except OSError:
+                    pass
+            print(f"Loaded cached embeddings from {npy_path}")
+            return store[1]
+        print(f"Cached embeddings at {npy_path} are not aligned with the catalog; rebuilding")
+
+    item_hashes = [hash_text(t) for t in texts]
+    previous, previous_matrix = _find_previous(cache_dir, model_name, template)
+
+    # Rows are reused by (url, text hash) when both entries have IDs, else by text hash
+    previous_ids, previous_hashes = previous or (None, [])
+    by_id = ids is not None and previous_ids is not None
+    keys = list(zip(ids, item_hashes)) if by_id else item_hashes
+    reuse = {}
+    for row, h in enumerate(previous_hashes):
+        reuse.setdefault((previous_ids[row], h) if by_id else h, row)
+
+    missing = [i for i, key in enumerate(keys) if key not in reuse]
+    print(f"Encoding {len(missing)}/{len(texts)} catalog items (rest reused from cache)...")
+
+    encoded = None
+    if missing:
+        encoded = np.asarray(encode([texts[i] for i in missing]), dtype=np.float32)
+
+    dim = encoded.shape[1] if encoded is not None else previous_matrix.shape[1]
+    matrix = np.empty((len(texts), dim), dtype=np.float32)
+    if encoded is not None:
+        matrix[missing] = encoded
+    for i, key in enumerate(keys):
+        if key in reuse:
+            matrix[i] = previous_matrix[reuse[key]]
+
+    return store_embeddings(matrix, texts, model_name, data_hash, template, cache_dir, item_hashes, ids)
+
+def store_embeddings(matrix, texts, model_name, data_hash, template, cache_dir, item_hashes=None, ids=None):
+    """
+    Write `matrix` (one row per text) as the cache entry for this catalog and
+    return it memory-mapped. Falls back to the in-memory matrix if the cache
+    directory is not writable.
+    """
+    key = cache_key(model_name, data_hash, template)
+    npy_path, _ = _paths(cache_dir, model_name, key)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    manifest = {
+        "version": CACHE_VERSION,
+        "model_name": model_name,
+        "data_hash": data_hash,
+        "template": template,
+        "count": len(texts),
+        "dim": int(matrix.shape[1]),
+        "dtype": str(matrix.dtype),
+    }
+    try:
+        _write(cache_dir, model_name, key, manifest, matrix, item_hashes or [hash_text(t) for t in texts], ids)
+        _prune(cache_dir, model_name, key)
+        return np.load(npy_path, mmap_mode="r")
+    except OSError as e:
+        print(f"Warning: could not write embedding cache to {cache_dir}: {e}")
+        return matrix
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Parity and cost check of the encoder backends in encoders.py against the
+# PyTorch model: cosine agreement of catalog and query embeddings, Recall@10
+# from evaluate.py, model load time, query latency and peak resident memory.
+# Each backend is measured in its own process so memory numbers don't mix.
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+def measure(backend, out_dir):
+    import pandas as pd
+    from engine import RecommendationEngine
+    from evaluate import TRAIN_FILE, calculate_recall_at_k
+
+    start = time.perf_counter()
+    engine = RecommendationEngine(encoder_backend=backend)
+    load_s = time.perf_counter() - start
+
+    queries = list(pd.read_csv(TRAIN_FILE)['Query'].unique())
+    single = []
+    for q in queries * 5:
+        t = time.perf_counter()
+        engine.model.encode([q])
+        single.append((time.perf_counter() - t) * 1000)
+    t = time.perf_counter()
+    query_embeddings = engine._encode(queries, batch_size=32)
+    batch_ms = (time.perf_counter() - t) * 1000 / len(queries)
+
+    np.save(os.path.join(out_dir, f"{backend}.catalog.npy"), np.asarray(engine.embeddings))
+    np.save(os.path.join(out_dir, f"{backend}.queries.npy"), query_embeddings)
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "query_p50_ms": float(np.percentile(single, 50)),
+        "query_p99_ms": float(np.percentile(single, 99)),
+        "batched_ms_per_query": batch_ms,
+        "peak_rss_mb": peak_rss_mb(),
+        "recall@10": calculate_recall_at_k(engine, 10),
+        "torch_imported": "torch" in sys.modules,
+    }
+
+def agreement(a, b):
+    cos = np.sum(a * b, axis=1)
+    return float(cos.mean()), float(cos.min())
+
+def compare(backends):
+    reports = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for backend in backends:
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", backend, "--out", out_dir],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"{backend}: failed\n{proc.stderr[-2000:]}")
+                continue
+            reports.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+        reference = backends[0]
+        ref_catalog = np.load(os.path.join(out_dir, f"{reference}.catalog.npy"))
+        ref_queries = np.load(os.path.join(out_dir, f"{reference}.queries.npy"))
+        for r in reports:
+            catalog = np.load(os.path.join(out_dir, f"{r['backend']}.catalog.npy"))
+            queries = np.load(os.path.join(out_dir, f"{r['backend']}.queries.npy"))
+            r["catalog_cos_mean"], r["catalog_cos_min"] = agreement(ref_catalog, catalog)
+            r["query_cos_mean"], r["query_cos_min"] = agreement(ref_queries, queries)
+
+    print(f"\nReference: {reference}")
+    header = f"{'backend':<10} {'cos mean':>9} {'cos min':>8} {'R@10':>6} {'load s':>7} {'p50 ms':>7} {'p99 ms':>7} {'batch ms/q':>10} {'peak MB':>8} {'torch':>6}"
+    print(header)
+    for r in reports:
+        print(f"{r['backend']:<10} {r['catalog_cos_mean']:>9.5f} {min(r['catalog_cos_min'], r['query_cos_min']):>8.5f} "
+              f"{r['recall@10']:>6.3f} {r['load_s']:>7.2f} {r['query_p50_ms']:>7.2f} {r['query_p99_ms']:>7.2f} "
+              f"{r['batched_ms_per_query']:>10.2f} {r['peak_rss_mb']:>8.0f} {str(r['torch_imported']):>6}")
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare encoder backends against PyTorch")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.out)))
+    else:
+        compare(args.backends)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+# Query/catalog encoders. Every backend exposes the SentenceTransformer-style
+# `encode(list[str], batch_size=...) -> ndarray` used by the engine.
+#
+#   torch      sentence-transformers on PyTorch (default)
+#   onnx       the same model exported to ONNX, run with ONNX Runtime
+#   onnx-int8  the ONNX model with dynamic int8 weight quantization
+#   stub       deterministic word-hashing vectors, no model (benchmarks, offline runs)
+#
+# The ONNX backends need torch + sentence-transformers only once, to export
+# the model; after that just onnxruntime and tokenizers are imported.
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8", "stub")
+
+def encoder_id(model_name, backend):
+    """Name used to key cached catalog embeddings for a model/backend pair."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def load_encoder(backend, model_name, cache_dir):
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {ENCODER_BACKENDS}")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == "stub":
+        return StubEncoder()
+    return OnnxEncoder(model_name, cache_dir, quantize=(backend == "onnx-int8"))
+
+def export_onnx(model_name, out_dir):
+    """Export the transformer of a sentence-transformers model plus its tokenizer to `out_dir`."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Exporting {model_name} to ONNX...")
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[n] for n in input_names),
+            path + ".tmp",
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=14,
+        )
+    os.replace(path + ".tmp", path)
+
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "max_seq_length": st_model.max_seq_length}, f)
+    return path
+
+def quantize_onnx(path, out_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    print("Quantizing ONNX model to int8...")
+    quantize_dynamic(path, out_path + ".tmp", weight_type=QuantType.QInt8)
+    os.replace(out_path + ".tmp", out_path)
+    return out_path
+
+class OnnxEncoder:
+    """
+    Sentence encoder running on ONNX Runtime: tokenizes with the exported
+    `tokenizer.json`, runs the transformer and mean-pools the token embeddings
+    over the attention mask, like the sentence-transformers Pooling module.
+    """
+    def __init__(self, model_name, cache_dir, quantize=False, model_dir=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        self.model_dir = model_dir or os.path.join(cache_dir, "onnx", safe)
+        path = os.path.join(self.model_dir, "model.onnx")
+        if not os.path.exists(path):
+            export_onnx(model_name, self.model_dir)
+        if quantize:
+            int8_path = os.path.join(self.model_dir, "model.int8.onnx")
+            if not os.path.exists(int8_path):
+                quantize_onnx(path, int8_path)
+            path = int8_path
+
+        with open(os.path.join(self.model_dir, "encoder.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.max_seq_length = config.get("max_seq_length", 256)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        out = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            feed = {k: v for k, v in feed.items() if k in self.input_names}
+
+            hidden = self.session.run(None, feed)[0]
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            out.append(pooled.astype(np.float32))
+
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(out)
+
+    def get_sentence_embedding_dimension(self):
+        return self.session.get_outputs()[0].shape[-1]
+
+class StubEncoder:
+    """
+    Deterministic stand-in for the model: a text is the sum of fixed random
+    vectors, one per word, seeded by the word's hash. Texts sharing words still
+    score higher than unrelated ones, but ranking quality is far below MiniLM;
+    it exists so benchmarks run fast, offline and reproducibly.
+    """
+    WORD_RE = re.compile(r"[a-z0-9+#.]+")
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._words = {}
+
+    def _word_vector(self, word):
+        vector = self._words.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._words[word] = vector
+        return vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        out = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, text in enumerate(sentences):
+            for word in self.WORD_RE.findall(str(text).lower()):
+                out[i] += self._word_vector(word)
+        return out
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
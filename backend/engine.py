@@ -1,124 +1,768 @@
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+import time
+from collections import namedtuple
 import numpy as np
+from bm25 import BM25Index
+from cache import LRUCache
+from catalog import CatalogColumns, extract_filters, filters_key
+from cross_encoder import CROSS_ENCODER, CROSS_ENCODER_MODEL, CrossReranker, load_cross_encoder
+from embedding_cache import artifact_path, hash_bytes, load_embeddings, store_embeddings
+from encoders import ENCODER_BACKENDS, encoder_id, load_encoder
+from index import build_index
+from jd import chunk_text, is_long_text, pool_scores
+from rerank import rerank_key, rerank_pool
+from scoring import EmbeddingMatrix, normalize_rows, top_k
+import metrics
+from query_norm import DEDUP_THRESHOLD, RecentQueries, fold, normalize_query, query_key
+import shared_snapshot
+from timing import stage
 
 DATA_FILE = "d:/shl/data/assessments.json"
+CACHE_DIR = os.path.join(os.path.dirname(DATA_FILE), "cache")
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# Inference backend for the model: torch, onnx or onnx-int8 (see encoders.py)
+ENCODER_BACKEND = os.environ.get("SHL_ENCODER", "torch")
+# Further models served side by side with MODEL_NAME and picked per request
+# ("model" in the /recommend body), e.g. "all-mpnet-base-v2,all-MiniLM-L6-v2@onnx":
+# comma-separated "name" or "name@backend". Each has its own vector store
+# (embedding_cache.py), so switching between them never re-encodes the catalog.
+EXTRA_MODELS = [m.strip() for m in os.environ.get("SHL_MODELS", "").split(",") if m.strip()]
+
+# Text embedded for each catalog item. Part of the embedding cache key, so
+# editing it invalidates cached vectors.
+CORPUS_TEMPLATE = "{assessment_name} {description}"
+
+# Number of top-scoring items handed to re-ranking (rerank.py)
+CANDIDATE_POOL = 30
+# Widest pool type quotas may grow it to, as a multiple of the result limit
+QUOTA_POOL_FACTOR = 10
+# Queries encoded per forward pass in search_many
+QUERY_BATCH_SIZE = 64
+# Storage dtype of the scoring matrix: float32, float16 or int8
+EMBEDDING_DTYPE = os.environ.get("SHL_EMBEDDING_DTYPE", "float32")
+# Nearest-neighbour backend: "exact" (brute force) or "ivf" (approximate, for large catalogs)
+INDEX_BACKEND = os.environ.get("SHL_INDEX", "exact")
+# IVF lists to create (default sqrt(n_items)) and to probe per query
+IVF_LISTS = int(os.environ["SHL_IVF_LISTS"]) if os.environ.get("SHL_IVF_LISTS") else None
+IVF_PROBE = int(os.environ.get("SHL_IVF_PROBE", "8"))
+# In-memory caches for repeated queries: normalized text (query_norm.py) ->
+# embedding and (normalized text hash, limit, ...) -> results. Size 0 disables; TTL in seconds (unset = no expiry).
+QUERY_CACHE_SIZE = int(os.environ.get("SHL_QUERY_CACHE_SIZE", "4096"))
+RESULT_CACHE_SIZE = int(os.environ.get("SHL_RESULT_CACHE_SIZE", "4096"))
+CACHE_TTL = float(os.environ["SHL_CACHE_TTL"]) if os.environ.get("SHL_CACHE_TTL") else None
+# Apply duration constraints stated in the query text ("within 45 mins") as filters
+QUERY_FILTERS = os.environ.get("SHL_QUERY_FILTERS", "1") == "1"
+# Hybrid retrieval: fuse the dense candidates with BM25 matches by reciprocal-rank fusion
+HYBRID_SEARCH = os.environ.get("SHL_HYBRID", "1") == "1"
+RRF_K = 60
+# Long queries (full job descriptions) are encoded in chunks and each item's
+# chunk scores pooled: "max", "mean" or "topN" (mean of the N best chunks)
+JD_POOLING = os.environ.get("SHL_JD_POOLING", "max")
+
+def build_corpus_text(item):
+    return CORPUS_TEMPLATE.format(
+        assessment_name=item['assessment_name'],
+        description=item.get('description', ''),
+    )
+
+def parse_model_spec(spec):
+    """("name", "backend") for an EXTRA_MODELS entry; the backend defaults to ENCODER_BACKEND."""
+    name, _, backend = spec.rpartition("@")
+    if name and backend in ENCODER_BACKENDS:
+        return name, backend
+    return spec, ENCODER_BACKEND
+
+def categorize(item):
+    t_type = item.get('test_type', '').upper()
+    return 'Hard' if any(x in t_type for x in ['K', 'S']) else 'Soft'
+
+# Everything derived from one version of the catalog. The engine swaps whole
+# snapshots, and each search reads `self.snapshot` once, so a reload never
+# mixes old and new arrays inside one request. `alternates` maps each extra
+# model id to a snapshot sharing the records, columns and BM25 index but with
+# that model's embeddings, scoring matrix and index.
+CatalogSnapshot = namedtuple(
+    "CatalogSnapshot",
+    ["assessments", "columns", "embeddings", "embedding_matrix", "index", "bm25", "data_hash", "version",
+     "model_id", "alternates"],
+)
+EMPTY_SNAPSHOT = CatalogSnapshot([], None, None, None, None, None, None, 0, None, {})
+
+# Result of one search: catalog rows and their scores, best first, plus the
+# snapshot the rows index into, since a reload may replace it meanwhile.
+SearchHits = namedtuple("SearchHits", ["rows", "scores", "snapshot"])
+
+def no_hits(snapshot):
+    return SearchHits(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), snapshot)
+
+def record_lookup(text, cached):
+    """Metrics for one result-cache lookup: hit or miss and the normalized query length in whitespace tokens."""
+    metrics.RESULT_CACHE.inc("miss" if cached is None else "hit")
+    metrics.QUERY_TOKENS.observe(text.count(" ") + 1 if text else 0)
 
 class RecommendationEngine:
-    def __init__(self):
-        self.assessments = []
-        self.embeddings = None
+    """
+    `state` moves from "loading" (reading catalog/model) to "embedding" to
+    "ready", or to "error" if loading failed. With `load=False` nothing is
+    loaded until `load_data` is called, e.g. from a background task.
+    """
+    def __init__(self, load: bool = True, encoder_backend: str = None):
+        self.encoder_backend = encoder_backend or ENCODER_BACKEND
+        self.state = "loading"
+        self.error = None
+        self.snapshot = EMPTY_SNAPSHOT
         self.model = None
-        self.load_data()
-        
+        self.model_id = None
+        # Query encoders by model id: the default one plus any EXTRA_MODELS
+        self.encoders = {}
+        # Optional second-stage scorer (cross_encoder.py), loaded with the model when SHL_CROSS_ENCODER is set
+        self.cross_reranker = None
+        # Set when serving a snapshot published by another process (see attach_shared)
+        self.shared_dir = None
+        self.shared_version = None
+        self._reload_lock = threading.Lock()
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE, CACHE_TTL)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE, CACHE_TTL)
+        # Near-duplicate reuse (query_norm.py): recent query vectors by model id
+        self.dedup_threshold = DEDUP_THRESHOLD
+        self.recent_queries = {}
+        if load:
+            self.load_data()
+
+    # Read-only views of the current snapshot
+    @property
+    def assessments(self):
+        return self.snapshot.assessments
+
+    @property
+    def embeddings(self):
+        return self.snapshot.embeddings
+
+    @property
+    def embedding_matrix(self):
+        return self.snapshot.embedding_matrix
+
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    @index.setter
+    def index(self, index):
+        self.snapshot = self.snapshot._replace(index=index)
+
     def load_data(self):
+        self.state = "loading"
+        self.error = None
+        try:
+            self._load_data()
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+            raise
+        self.state = "ready"
+
+    def _load_data(self):
+        # Cached embeddings/results refer to the previous catalog and model
+        self.query_cache.clear()
+        self.clear_results()
+
         if not os.path.exists(DATA_FILE):
             print(f"Warning: {DATA_FILE} not found. Engine will be empty.")
             return
 
-        with open(DATA_FILE, "r") as f:
-            self.assessments = json.load(f)
+        with open(DATA_FILE, "rb") as f:
+            raw = f.read()
+        assessments = json.loads(raw)
             
-        print(f"Loaded {len(self.assessments)} assessments.")
+        print(f"Loaded {len(assessments)} assessments.")
         
         # Categorize assessments
-        for item in self.assessments:
-            t_type = item.get('test_type', '').upper()
-            if any(x in t_type for x in ['K', 'S']):
-                item['category'] = 'Hard'
-            else:
-                item['category'] = 'Soft'
+        for item in assessments:
+            item['category'] = categorize(item)
         
-        # Initialize model
-        print("Loading embedding model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Initialize model. Backends import their runtime lazily, so importing
+        # this module (e.g. from the API or helper scripts) doesn't pull in torch.
+        print(f"Loading embedding model ({self.encoder_backend})...")
+        self.model = load_encoder(self.encoder_backend, MODEL_NAME, CACHE_DIR)
+        self.model_id = encoder_id(MODEL_NAME, self.encoder_backend)
+        self.encoders[self.model_id] = self.model
+        self._load_cross_encoder()
         
-        # Pre-compute embeddings
+        # Pre-compute L2-normalized embeddings (or map them from the on-disk cache)
         print("Generating embeddings...")
-        corpus = [f"{item['assessment_name']} {item.get('description', '')}" for item in self.assessments]
-        self.embeddings = self.model.encode(corpus)
+        self.state = "embedding"
+        corpus = [build_corpus_text(item) for item in assessments]
+        data_hash = hash_bytes(raw)
+        embeddings = load_embeddings(
+            self._encode, corpus, self.model_id, data_hash, CORPUS_TEMPLATE, CACHE_DIR,
+            ids=[item.get('assessment_url') for item in assessments],
+        )
+        snapshot = self._build_snapshot(assessments, embeddings, data_hash)
+        self.snapshot = self._with_alternates(snapshot, corpus)
         print("Embeddings ready.")
 
-    def search(self, query: str, limit: int = 10):
-        if not self.assessments:
-            return []
-            
-        query_embedding = self.model.encode([query])
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
-        
-        # Get top 30 candidates to have a pool for balancing
-        top_indices = np.argsort(similarities)[::-1][:30]
-        
-        candidates = []
-        for idx in top_indices:
-            item = self.assessments[idx].copy()
-            item['score'] = float(similarities[idx])
-            candidates.append(item)
-            
-        return self._balance_results(candidates, query, limit)
+    def attach_shared(self, directory):
+        """
+        Serve the snapshot published in `directory` (see shared_snapshot.py)
+        instead of loading the catalog: only the query encoder is loaded here,
+        every catalog array is memory-mapped from the publishing process.
+        """
+        # A failed first attach leaves nothing to serve; a failed re-attach keeps the current snapshot
+        first = self.shared_version is None
+        if first:
+            self.state = "loading"
+            self.error = None
+        try:
+            if self.model is None:
+                print(f"Loading embedding model ({self.encoder_backend})...")
+                self.model = load_encoder(self.encoder_backend, MODEL_NAME, CACHE_DIR)
+                self.model_id = encoder_id(MODEL_NAME, self.encoder_backend)
+                self.encoders[self.model_id] = self.model
+            self._load_cross_encoder()
+            version, manifest, fields = shared_snapshot.attach(directory)
+            if manifest["model_id"] != self.model_id:
+                raise ValueError(
+                    f"Published snapshot was encoded with {manifest['model_id']}, this worker uses {self.model_id}"
+                )
+            snapshot = CatalogSnapshot(version=self.snapshot.version + 1, model_id=self.model_id, alternates={}, **fields)
+            if EXTRA_MODELS:
+                # Not published; each worker maps the stores the publishing process wrote
+                snapshot = self._with_alternates(snapshot, [build_corpus_text(item) for item in snapshot.assessments])
+            self.snapshot = snapshot
+            self.shared_dir, self.shared_version = directory, version
+            self.clear_results()
+        except Exception as e:
+            if first:
+                self.state = "error"
+                self.error = str(e)
+            raise
+        self.state = "ready"
+        print(f"Attached shared snapshot {version} ({manifest['count']} assessments)")
 
-    def _balance_results(self, candidates, query, limit):
-        if not candidates:
-            return []
-            
-        # Separate into categories
-        hard_items = [c for c in candidates if c['category'] == 'Hard']
-        soft_items = [c for c in candidates if c['category'] == 'Soft']
-        
-        # Simple heuristic: Check for obvious soft skill keywords in query
-        soft_keywords = ['team', 'collaborat', 'communicat', 'lead', 'manag', 'person', 'behav', 'soft', 'interpersonal', 'cultur']
-        query_lower = query.lower()
-        needs_soft = any(k in query_lower for k in soft_keywords)
-        
-        results = []
-        
-        # Logic:
-        # 1. Always take the absolute best match (score likely highest).
-        # 2. If 'needs_soft' is true, try to interleave Soft items if they are reasonable.
-        # 3. Otherwise, just ensure we don't return 100% homogenous results IF the other category has decent candidates.
-        
-        # Strategy: Pick top items, but force at least some ratio if candidates exist.
-        
-        # If user explicitly asks for mixed skills (inferred from needs_soft and presence of hard skills implied by results),
-        # we aim for a mix.
+    def _load_cross_encoder(self, backend=CROSS_ENCODER):
+        if backend and self.cross_reranker is None:
+            print(f"Loading cross-encoder ({backend})...")
+            self.cross_reranker = CrossReranker(load_cross_encoder(backend, CROSS_ENCODER_MODEL))
+
+    def _build_snapshot(self, assessments, embeddings, data_hash, previous_index=None):
+        embedding_matrix, index = self._model_vectors(self.model_id, embeddings, data_hash, previous_index)
+        bm25 = BM25Index([build_corpus_text(item) for item in assessments]) if HYBRID_SEARCH else None
+        return CatalogSnapshot(
+            assessments, CatalogColumns(assessments), embeddings, embedding_matrix, index, bm25,
+            data_hash, self.snapshot.version + 1, self.model_id, {},
+        )
+
+    def _model_vectors(self, model_id, embeddings, data_hash, previous_index=None):
+        """Scoring matrix and nearest-neighbour index over one model's catalog embeddings."""
+        embedding_matrix = EmbeddingMatrix(embeddings, EMBEDDING_DTYPE)
+        index_file = artifact_path(
+            CACHE_DIR, model_id, data_hash, CORPUS_TEMPLATE, f".{INDEX_BACKEND}{IVF_LISTS or ''}.npz"
+        )
+        index = build_index(
+            INDEX_BACKEND, embedding_matrix, index_file, IVF_LISTS, IVF_PROBE, previous=previous_index
+        )
+        return embedding_matrix, index
+
+    def _with_alternates(self, snapshot, corpus, previous=None):
+        """
+        `snapshot` with one alternate per EXTRA_MODELS entry. Each model's vectors
+        are mapped from its store when it matches this catalog; otherwise only new
+        or edited items are encoded (all of them the first time a model is added).
+        """
+        alternates = {}
+        ids = [item.get('assessment_url') for item in snapshot.assessments]
+        for spec in EXTRA_MODELS:
+            name, backend = parse_model_spec(spec)
+            model_id = encoder_id(name, backend)
+            if model_id == self.model_id or model_id in alternates:
+                continue
+            if model_id not in self.encoders:
+                print(f"Loading alternate model {model_id}...")
+                self.encoders[model_id] = load_encoder(backend, name, CACHE_DIR)
+            embeddings = load_embeddings(
+                lambda texts, model_id=model_id: self._encode(texts, model_id=model_id),
+                corpus, model_id, snapshot.data_hash, CORPUS_TEMPLATE, CACHE_DIR, ids=ids,
+            )
+            old = previous.alternates.get(model_id) if previous is not None else None
+            embedding_matrix, index = self._model_vectors(
+                model_id, embeddings, snapshot.data_hash, old.index if old is not None else None
+            )
+            alternates[model_id] = snapshot._replace(
+                embeddings=embeddings, embedding_matrix=embedding_matrix, index=index, model_id=model_id
+            )
+        return snapshot._replace(alternates=alternates)
+
+    @property
+    def models(self):
+        """Model ids that can be searched: the default first, then the alternates."""
+        return [self.model_id] + list(self.snapshot.alternates) if self.model_id else []
+
+    def _route(self, snapshot, model):
+        """The snapshot to search for `model` (a model id; None for the default)."""
+        if model is None or model == snapshot.model_id:
+            return snapshot
+        try:
+            return snapshot.alternates[model]
+        except KeyError:
+            raise ValueError(f"Unknown model {model!r}; loaded: {[snapshot.model_id, *snapshot.alternates]}")
+
+    def reload_data(self):
+        """
+        Incrementally reload DATA_FILE while the engine keeps serving.
+
+        Items are matched to the current catalog by `assessment_url`; only added
+        items and items whose corpus text changed are encoded, and categories are
+        recomputed only for added or changed rows. The new snapshot is swapped in
+        with one assignment, so in-flight searches finish on the old one.
+        Returns a summary of what changed.
+        """
+        with self._reload_lock:
+            if self.shared_dir is not None:
+                # The publishing process owns the catalog; pick up its latest version
+                previous = self.shared_version
+                if shared_snapshot.current_version(self.shared_dir) != previous:
+                    self.attach_shared(self.shared_dir)
+                return {"shared_version": self.shared_version, "changed": self.shared_version != previous,
+                        "assessments": len(self.assessments)}
+            if self.state != "ready" or self.model is None:
+                self.load_data()
+                return {"full_reload": True, "assessments": len(self.assessments)}
+
+            start = time.perf_counter()
+            with open(DATA_FILE, "rb") as f:
+                raw = f.read()
+            data_hash = hash_bytes(raw)
+            old = self.snapshot
+            if data_hash == old.data_hash:
+                return {"changed": 0, "added": 0, "removed": 0, "unchanged": len(old.assessments),
+                        "seconds": time.perf_counter() - start}
+
+            old_rows = {item.get('assessment_url'): row for row, item in enumerate(old.assessments)}
+            assessments = json.loads(raw)
+            corpus = [build_corpus_text(item) for item in assessments]
+
+            reused = []      # (new row, old row) with identical corpus text
+            to_encode = []   # new rows needing a fresh embedding
+            added = changed = 0
+            for row, item in enumerate(assessments):
+                old_row = old_rows.get(item.get('assessment_url'))
+                if old_row is None:
+                    added += 1
+                    item['category'] = categorize(item)
+                    to_encode.append(row)
+                    continue
+
+                old_item = old.assessments[old_row]
+                if item.get('test_type') == old_item.get('test_type'):
+                    item['category'] = old_item['category']
+                else:
+                    item['category'] = categorize(item)
+
+                if corpus[row] == build_corpus_text(old_item):
+                    reused.append((row, old_row))
+                else:
+                    to_encode.append(row)
+                if {k: v for k, v in item.items() if k != 'category'} != \
+                        {k: v for k, v in old_item.items() if k not in ('category', 'score')}:
+                    changed += 1
+            removed = len(old.assessments) - (len(assessments) - added)
+
+            dim = old.embeddings.shape[1] if old.embeddings is not None and old.embeddings.size else None
+            encoded = self._encode([corpus[r] for r in to_encode]) if to_encode else None
+            if dim is None:
+                dim = encoded.shape[1] if encoded is not None else 0
+            embeddings = np.empty((len(assessments), dim), dtype=np.float32)
+            if reused:
+                new_rows, prev_rows = zip(*reused)
+                embeddings[list(new_rows)] = old.embeddings[list(prev_rows)]
+            if encoded is not None:
+                embeddings[to_encode] = encoded
+
+            embeddings = store_embeddings(
+                embeddings, corpus, self.model_id, data_hash, CORPUS_TEMPLATE, CACHE_DIR,
+                ids=[item.get('assessment_url') for item in assessments],
+            )
+            snapshot = self._build_snapshot(assessments, embeddings, data_hash, previous_index=old.index)
+            self.snapshot = self._with_alternates(snapshot, corpus, previous=old)
+            # Results refer to the old catalog; query embeddings only depend on the model
+            self.clear_results()
+
+            summary = {
+                "added": added,
+                "changed": changed,
+                "removed": removed,
+                "encoded": len(to_encode),
+                "assessments": len(assessments),
+                "seconds": time.perf_counter() - start,
+            }
+            print(f"Catalog reloaded: {summary}")
+            return summary
+
+    def search(self, query: str, limit: int = 10, filters: dict = None, rerank: dict = None, timings: dict = None,
+               model: str = None):
+        """Result dicts (catalog record plus `score`), best first. Arguments as in `search_hits`."""
+        return self.to_dicts(self.search_hits(query, limit, filters=filters, rerank=rerank, timings=timings, model=model))
+
+    def search_many(self, queries, limit: int = 10, batch_size: int = QUERY_BATCH_SIZE, filters: dict = None,
+                    rerank: dict = None, timings: dict = None, model: str = None):
+        """One list of result dicts per query, as `search`. Arguments as in `search_many_hits`."""
+        found = self.search_many_hits(
+            queries, limit, batch_size, filters=filters, rerank=rerank, timings=timings, model=model
+        )
+        return [self.to_dicts(hits) for hits in found]
+
+    def search_hits(self, query: str, limit: int = 10, filters: dict = None, rerank: dict = None,
+                    timings: dict = None, model: str = None):
+        """
+        `filters` may set max_duration/min_duration (minutes), test_types (SHL keys,
+        any of), remote and adaptive. They are merged over constraints extracted
+        from the query text and applied before candidate selection.
+        `rerank` options (mmr_lambda, type_quotas, balance) shape the final list;
+        see rerank.py.
+        Pass a `timings` dict to collect seconds per search stage (see timing.py).
+        `model` picks one of `self.models` (default: MODEL_NAME); unknown ids raise ValueError.
+
+        Returns SearchHits: catalog rows and scores only. Search and balancing
+        never touch the records; to_dicts / to_json build output for the final rows.
+        """
+        snapshot = self.snapshot
+        if self.state != "ready" or not snapshot.assessments:
+            return no_hits(snapshot)
+        snapshot = self._route(snapshot, model)
+
+        # Filters come from the text as sent and search runs on its folded form;
+        # the normalized text only keys the caches
+        filters = self._query_filters(query, filters)
+        text = fold(query)
+        canonical = normalize_query(query)
+        key = (query_key(canonical), limit, snapshot.version, filters_key(filters), rerank_key(rerank), snapshot.model_id)
+        cached = self.result_cache.get(key)
+        record_lookup(canonical, cached)
+        if cached is not None:
+            return cached
+
+        mask = snapshot.columns.mask(filters)
+        query_embedding = None
+        if not is_long_text(query):
+            with stage(timings, "encode"):
+                query_embedding = self._encode_queries([text], model_id=snapshot.model_id)[0]
+            near = self._near_duplicate(snapshot, query_embedding, key)
+            if near is not None:
+                self.result_cache.put(key, near)
+                return near
+        # Get top candidates to have a pool for balancing
+        pool = self._candidates(snapshot, query, text, query_embedding, mask, CANDIDATE_POOL, timings)
         
-        # If we have both types available with decent scores:
-        if hard_items and soft_items:
-            best_hard_score = hard_items[0]['score']
-            best_soft_score = soft_items[0]['score']
-            
-            # If scores are comparable (within 20%), force mix
-            score_diff = abs(best_hard_score - best_soft_score)
-            comparable = score_diff < 0.15 
-            
-            if comparable or needs_soft:
-                # Interleave approach
-                h_idx, s_idx = 0, 0
-                while len(results) < limit:
-                    # Pick Hard
-                    if h_idx < len(hard_items):
-                        results.append(hard_items[h_idx])
-                        h_idx += 1
-                    
-                    if len(results) >= limit: break
-                    
-                    # Pick Soft
-                    if s_idx < len(soft_items):
-                        results.append(soft_items[s_idx])
-                        s_idx += 1
-                        
-                    if h_idx >= len(hard_items) and s_idx >= len(soft_items):
-                        break
+        [(top_indices, top_scores)], complete = self._cross_rescore(snapshot, [text], [pool], rerank, timings)
+        with stage(timings, "rerank"):
+            hits = self._rerank(snapshot, top_indices, top_scores, text, limit, rerank)
+        hits, complete = self._fill_quotas(
+            snapshot, query, text, query_embedding, mask, limit, rerank, hits, complete, timings
+        )
+        if complete:
+            self.result_cache.put(key, hits)
+            if query_embedding is not None:
+                self._remember(snapshot, query_embedding, key, hits)
+        return hits
+
+    def search_many_hits(self, queries, limit: int = 10, batch_size: int = QUERY_BATCH_SIZE, filters: dict = None,
+                         rerank: dict = None, timings: dict = None, model: str = None):
+        """
+        Search several queries at once. Queries are encoded `batch_size` at a time
+        and each batch is scored against the index in one call. Returns one
+        SearchHits per query, in input order. Other arguments are as in `search_hits`.
+        """
+        snapshot = self.snapshot
+        if self.state != "ready" or not snapshot.assessments:
+            return [no_hits(snapshot) for _ in queries]
+        snapshot = self._route(snapshot, model)
+
+        queries = list(queries)
+        query_filters = [self._query_filters(q, filters) for q in queries]
+        texts = [fold(q) for q in queries]
+        canonical = [normalize_query(q) for q in queries]
+        keys = [
+            (query_key(c), limit, snapshot.version, filters_key(f), rerank_key(rerank), snapshot.model_id)
+            for c, f in zip(canonical, query_filters)
+        ]
+        results = [None] * len(queries)
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.result_cache.get(key)
+            record_lookup(canonical[i], cached)
+            if cached is not None:
+                results[i] = cached
             else:
-                # One category is clearly dominant, just return by score
-                results = candidates[:limit]
-        else:
-             results = candidates[:limit]
+                pending.append(i)
+
+        # Candidate pools first, so the cross-encoder can score all queries in one pass
+        pools = {}
+        query_embeddings_by_row = {}
+        # Job descriptions go through the chunked path one at a time
+        for i in [i for i in pending if is_long_text(queries[i])]:
+            pools[i] = self._search_long(snapshot, queries[i], snapshot.columns.mask(query_filters[i]), timings)
+        pending = [i for i in pending if i not in pools]
+
+        for start in range(0, len(pending), batch_size):
+            rows = pending[start:start + batch_size]
+            with stage(timings, "encode"):
+                query_embeddings = self._encode_queries(
+                    [texts[i] for i in rows], batch_size=batch_size, model_id=snapshot.model_id
+                )
+            # Near-duplicates of recent queries reuse their results; the rest are searched
+            searched = []
+            for row, i in enumerate(rows):
+                near = self._near_duplicate(snapshot, query_embeddings[row], keys[i])
+                if near is None:
+                    searched.append(row)
+                    query_embeddings_by_row[i] = query_embeddings[row]
+                else:
+                    results[i] = near
+                    self.result_cache.put(keys[i], near)
+            if not searched:
+                continue
+            if len(searched) < len(rows):
+                rows = [rows[row] for row in searched]
+                query_embeddings = query_embeddings[searched]
+            masks = [snapshot.columns.mask(query_filters[i]) for i in rows]
+            mask = None
+            if any(m is not None for m in masks):
+                everything = np.ones(len(snapshot.assessments), dtype=bool)
+                mask = np.stack([everything if m is None else m for m in masks])
+            top_indices, top_scores = snapshot.index.search(query_embeddings, CANDIDATE_POOL, mask=mask, timings=timings)
+
+            for row, i in enumerate(rows):
+                row_mask = None if mask is None else mask[row]
+                query_embedding = query_embeddings[row]
+                with stage(timings, "fuse"):
+                    pools[i] = self._fuse_lexical(
+                        snapshot, texts[i], top_indices[row], top_scores[row], row_mask,
+                        lambda rows: snapshot.embedding_matrix.score_rows(query_embedding, rows),
+                    )
+
+        order = list(pools)
+        rescored, complete = self._cross_rescore(
+            snapshot, [texts[i] for i in order], [pools[i] for i in order], rerank, timings
+        )
+        for i, (top_indices, top_scores) in zip(order, rescored):
+            with stage(timings, "rerank"):
+                results[i] = self._rerank(snapshot, top_indices, top_scores, texts[i], limit, rerank)
+            results[i], done = self._fill_quotas(
+                snapshot, queries[i], texts[i], query_embeddings_by_row.get(i),
+                snapshot.columns.mask(query_filters[i]), limit, rerank, results[i], complete, timings,
+            )
+            if done:
+                self.result_cache.put(keys[i], results[i])
+                if i in query_embeddings_by_row:
+                    self._remember(snapshot, query_embeddings_by_row[i], keys[i], results[i])
+
+        return results
+
+    def to_dicts(self, hits):
+        """Result dicts for `hits`: a copy of each catalog record plus its `score`."""
+        results = []
+        for row, score in zip(hits.rows.tolist(), hits.scores.tolist()):
+            item = dict(hits.snapshot.assessments[row])
+            item['score'] = score
+            results.append(item)
+        return results
+
+    def to_json(self, hits):
+        """JSON body of a /recommend response for `hits`, joined from pre-serialized per-row fragments."""
+        fragments = hits.snapshot.columns.fragments
+        items = (fragments[row] + repr(score).encode() + b"}" for row, score in zip(hits.rows.tolist(), hits.scores.tolist()))
+        return b"[" + b",".join(items) + b"]"
+
+    def cache_stats(self):
+        stats = {"query_embeddings": self.query_cache.stats(), "results": self.result_cache.stats()}
+        if self.recent_queries:
+            stats["near_duplicates"] = {model_id: recent.stats() for model_id, recent in self.recent_queries.items()}
+        if self.cross_reranker is not None:
+            stats["cross_encoder"] = self.cross_reranker.stats()
+        return stats
+
+    def clear_results(self):
+        """Drop cached and recently served results, e.g. when they refer to a replaced snapshot."""
+        self.result_cache.clear()
+        for recent in self.recent_queries.values():
+            recent.clear()
+
+    def _near_duplicate(self, snapshot, query_embedding, key):
+        """Results of a recent query whose vector is within dedup_threshold of `query_embedding`, else None."""
+        recent = self.recent_queries.get(snapshot.model_id)
+        if not self.dedup_threshold or recent is None:
+            return None
+        # Everything but the text must match: limit, catalog version, filters and rerank options
+        near = recent.lookup(query_embedding, key[1:], self.dedup_threshold)
+        if near is not None:
+            metrics.NEAR_DUPLICATES.inc()
+        return near
+
+    def _remember(self, snapshot, query_embedding, key, hits):
+        if self.dedup_threshold:
+            recent = self.recent_queries.get(snapshot.model_id)
+            if recent is None:
+                recent = self.recent_queries.setdefault(snapshot.model_id, RecentQueries())
+            recent.add(query_embedding, key[1:], hits)
+
+    def _encode_queries(self, queries, batch_size: int = QUERY_BATCH_SIZE, model_id: str = None):
+        """
+        Normalized query embeddings, encoding only queries missing from the query
+        cache. The cache is keyed by normalized text; what is encoded is the
+        folded query, so boilerplate stripping never changes a vector.
+        """
+        model_id = model_id or self.model_id
+        keys = [(model_id, normalize_query(q)) for q in queries]
+        vectors = [self.query_cache.get(k) for k in keys]
+
+        # First query of each missing key, as sent
+        missing = {}
+        for k, q, v in zip(keys, queries, vectors):
+            if v is None:
+                missing.setdefault(k, fold(q))
+        if missing:
+            texts = list(missing.values())
+            encoded = dict(zip(missing, self._encode(texts, batch_size=batch_size, model_id=model_id)))
+            for k, v in encoded.items():
+                self.query_cache.put(k, v.copy())
+            vectors = [encoded[k] if v is None else v for k, v in zip(keys, vectors)]
+
+        return np.stack(vectors)
+
+    def _encode(self, texts, batch_size: int = QUERY_BATCH_SIZE, model_id: str = None):
+        model = self.model if model_id in (None, self.model_id) else self.encoders[model_id]
+        return normalize_rows(model.encode(texts, batch_size=batch_size))
+
+    def _candidates(self, snapshot, query, text, query_embedding, mask, pool, timings=None):
+        """Fused candidate pool of `pool` items for one query (`query_embedding` is None for long queries)."""
+        if query_embedding is None:
+            return self._search_long(snapshot, query, mask, timings, pool)
+        top_indices, top_scores = snapshot.index.search(query_embedding, pool, mask=mask, timings=timings)
+        with stage(timings, "fuse"):
+            return self._fuse_lexical(
+                snapshot, text, top_indices, top_scores, mask,
+                lambda rows: snapshot.embedding_matrix.score_rows(query_embedding, rows), pool,
+            )
+
+    def _fill_quotas(self, snapshot, query, text, query_embedding, mask, limit, rerank, hits, complete, timings=None):
+        """
+        Type quotas drop candidates, so a pool of CANDIDATE_POOL may leave fewer
+        than `limit` results. Then the search is repeated with a doubled pool
+        until `limit` are found, the pool holds every item passing the filters
+        or it reaches QUOTA_POOL_FACTOR * limit (quotas summing to less than
+        `limit` can never be filled). Returns (hits, complete) of the last pass.
+        """
+        if not (rerank or {}).get("type_quotas"):
+            return hits, complete
+        size = CANDIDATE_POOL
+        available = len(snapshot.assessments) if mask is None else int(np.count_nonzero(mask))
+        available = min(available, max(CANDIDATE_POOL, QUOTA_POOL_FACTOR * limit))
+        while len(hits.rows) < limit and size < available:
+            size = min(2 * size, available)
+            pool = self._candidates(snapshot, query, text, query_embedding, mask, size, timings)
+            [(top_indices, top_scores)], complete = self._cross_rescore(snapshot, [text], [pool], rerank, timings)
+            with stage(timings, "rerank"):
+                hits = self._rerank(snapshot, top_indices, top_scores, text, limit, rerank)
+        return hits, complete
+
+    def _search_long(self, snapshot, query, mask, timings=None, pool=CANDIDATE_POOL):
+        """
+        Candidates for a long query. All chunks are encoded in one batch and
+        scored against the catalog in one matrix product; the (n_chunks, n_items)
+        scores are pooled per item with JD_POOLING.
+        """
+        with stage(timings, "encode"):
+            chunk_embeddings = self._encode_queries(chunk_text(query), model_id=snapshot.model_id)
+        with stage(timings, "score"):
+            scores = pool_scores(snapshot.embedding_matrix.score(chunk_embeddings), JD_POOLING)
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+        with stage(timings, "topk"):
+            top = top_k(scores, pool)
+        with stage(timings, "fuse"):
+            return self._fuse_lexical(snapshot, query, top, scores[top], mask, lambda rows: scores[rows], pool)
+
+    def _fuse_lexical(self, snapshot, query, indices, scores, mask, dense_scores, pool=CANDIDATE_POOL):
+        """
+        Reciprocal-rank fusion of the dense candidates with the BM25 top matches.
+        Returns the `pool` best fused items, best first, each with its
+        dense cosine score so re-ranking keeps comparing cosine values. The
+        pool is therefore in fused order, not score order.
+        `dense_scores(rows)` gives that score for BM25 matches outside the dense pool.
+        """
+        if snapshot.bm25 is None:
+            return indices, scores
+
+        dense = {int(i): float(s) for i, s in zip(indices, scores) if np.isfinite(s)}
+        fused = {}
+        for rank, idx in enumerate(dense):
+            fused[idx] = 1.0 / (RRF_K + rank + 1)
+        lexical = snapshot.bm25.top_k(query, pool, mask)
+        for rank, idx in enumerate(lexical.tolist()):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        order = sorted(fused, key=fused.get, reverse=True)[:pool]
+        missing = [i for i in order if i not in dense]
+        if missing:
+            extra = dense_scores(np.array(missing))
+            dense.update(zip(missing, extra.tolist()))
+        return np.array(order, dtype=np.int64), np.array([dense[i] for i in order], dtype=np.float32)
+
+    def _cross_rescore(self, snapshot, queries, pools, options=None, timings=None):
+        """
+        Candidate pools reordered by the cross-encoder when it is loaded and not
+        turned off in `options`, and whether that finished within the budget
+        (see cross_encoder.py). Without it the pools come back unchanged.
+        """
+        options = options or {}
+        if self.cross_reranker is None or not options.get("cross_encoder", True) or not pools:
+            return pools, True
+        assessments = snapshot.assessments
+        with stage(timings, "cross"):
+            pools, complete = self.cross_reranker.rescore(
+                queries, pools, lambda row: build_corpus_text(assessments[row]),
+                top_n=options.get("cross_encoder_top_n"), budget_ms=options.get("budget_ms"),
+            )
+        metrics.CROSS_ENCODER_PASSES.inc("full" if complete else "cut")
+        return pools, complete
+
+    def _query_filters(self, query, filters):
+        found = extract_filters(query, assessment_sentences_only=is_long_text(query)) if QUERY_FILTERS else {}
+        found.update({k: v for k, v in (filters or {}).items() if v is not None})
+        return found
+
+    def _rerank(self, snapshot, indices, scores, query, limit, options=None):
+        """SearchHits for the final `limit` rows picked from the candidate pool (see rerank.py)."""
+        # Padding: fewer items passed the filters than the pool size
+        finite = np.isfinite(scores)
+        indices, scores = np.asarray(indices)[finite], np.asarray(scores, dtype=np.float32)[finite]
+        metrics.CANDIDATE_POOL_SIZE.observe(len(indices))
+        columns = snapshot.columns
+        order = rerank_pool(
+            scores, query, limit, columns.hard[indices], columns.type_mask[indices],
+            embeddings=lambda: snapshot.embedding_matrix.dense(indices), options=options,
+        )
+        rows, scores = indices[order], scores[order]
+        # Hits are shared through the result cache
+        rows.flags.writeable = scores.flags.writeable = False
+        return SearchHits(rows, scores, snapshot)
+
+# Singleton instance, created on first use so importing this module stays cheap
+_engine = None
+_engine_lock = threading.Lock()
 
-        # Deduplicate just in case (though indices are unique)
-        return results[:limit]
+def get_engine(load: bool = True):
+    """Return the shared engine. With load=False the caller is responsible for calling load_data."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RecommendationEngine(load=load)
+    return _engine
 
-# Singleton instance
-engine = RecommendationEngine()
+def __getattr__(name):
+    # Keeps `from engine import engine` working for the offline scripts
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
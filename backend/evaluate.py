@@ -1,7 +1,13 @@
 import pandas as pd
 import numpy as np
+import argparse
+import json
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from catalog import test_type_mask
+from timing import STAGES, merge_timings
 
 # We will measure Mean Recall@K
 # Since we don't have a perfect ground truth mapping for every possible query, 
@@ -10,10 +16,9 @@ import re
 
 DATA_FILE = "d:/shl/data/assessments.json"
 TRAIN_FILE = "d:/shl/data/train.csv"
+TEST_FILE = "d:/shl/data/test.csv"
 K = 10
 
-from engine import engine
-
 def normalize_url(url):
     """Normalize URL to handle minor variations (e.g. trailing slash, https vs http)"""
     if not url: return ""
@@ -24,62 +29,399 @@ def normalize_url(url):
         return parts[-1].lower()
     return url.lower()
 
+def load_ground_truth(path):
+    """
+    {query: [relevant assessment slugs]} from a Query/Assessment_url CSV, grouped
+    in one pass. Queries keep their order of first appearance.
+    """
+    df = pd.read_csv(path, usecols=['Query', 'Assessment_url']).dropna()
+    grouped = df.groupby('Query', sort=False)['Assessment_url'].agg(list)
+    return {query: list(dict.fromkeys(normalize_url(u) for u in urls)) for query, urls in grouped.items()}
+
+def ranking_metrics(ranked, relevant, ks):
+    """Recall, hit rate, MAP and nDCG at each k, plus reciprocal rank, for one ranked list."""
+    relevant = set(relevant)
+    hits = np.array([u in relevant for u in ranked], dtype=bool)
+    positions = np.flatnonzero(hits) + 1
+
+    metrics = {"mrr": 1.0 / float(positions[0]) if len(positions) else 0.0}
+    for k in ks:
+        top = positions[positions <= k]
+        n_ideal = min(len(relevant), k)
+        metrics[f"recall@{k}"] = len(top) / len(relevant)
+        metrics[f"hit@{k}"] = float(len(top) > 0)
+        metrics[f"map@{k}"] = float(np.sum(np.arange(1, len(top) + 1) / top)) / n_ideal
+        ideal_dcg = np.sum(1.0 / np.log2(np.arange(2, n_ideal + 2)))
+        metrics[f"ndcg@{k}"] = float(np.sum(1.0 / np.log2(top + 1)) / ideal_dcg)
+    return metrics
+
+def evaluate(engine, ks=(1, 3, 5, 10), path=None, batch_size=64, workers=1, rerank=None, model=None):
+    """
+    Score every query in `path` through engine.search_many and return a report
+    with mean ranking metrics, per-stage timings and throughput. Batches are
+    searched by `workers` threads and their metrics are summed as they finish.
+    The engine caches (and cross-encoder pair scores) are cleared first so
+    timings are for cold queries.
+    `rerank` options are passed to every search (see rerank.py), and `model`
+    picks one of the engine's loaded models (default: its main one).
+    """
+    path = path or TRAIN_FILE
+    truth = load_ground_truth(path)
+    queries = list(truth)
+    ks = sorted(set(ks))
+    engine.query_cache.clear()
+    engine.clear_results()
+    if engine.cross_reranker is not None:
+        engine.cross_reranker.pair_cache.clear()
+
+    def run(batch):
+        timings = {}
+        start = time.perf_counter()
+        results = engine.search_many(
+            batch, limit=max(ks), batch_size=batch_size, rerank=rerank, timings=timings, model=model
+        )
+        return batch, results, timings, time.perf_counter() - start
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    totals, timings, batch_seconds = {}, {}, []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch, results, batch_timings, seconds in pool.map(run, batches):
+            for query, found in zip(batch, results):
+                ranked = [normalize_url(r['assessment_url']) for r in found]
+                metrics = ranking_metrics(ranked, truth[query], ks)
+                # Diversity: distinct SHL test type keys among the results
+                metrics[f"types@{max(ks)}"] = bin(test_type_mask(",".join(r['test_type'] for r in found))).count("1")
+                for name, value in metrics.items():
+                    totals[name] = totals.get(name, 0.0) + value
+            merge_timings(timings, batch_timings)
+            batch_seconds.append(seconds)
+    wall = time.perf_counter() - start
+
+    n = max(len(queries), 1)
+    snapshot = engine.snapshot
+    return {
+        "dataset": os.path.abspath(path),
+        "queries": len(queries),
+        "k": ks,
+        "config": {
+            "model": model or engine.model_id,
+            "index": getattr(snapshot.index, "name", None),
+            "embedding_dtype": getattr(snapshot.embedding_matrix, "dtype", None),
+            "hybrid": snapshot.bm25 is not None,
+            "catalog_size": len(snapshot.assessments),
+            "batch_size": batch_size,
+            "workers": workers,
+            "rerank": rerank or {},
+            "cross_encoder": engine.cross_reranker is not None and (rerank or {}).get("cross_encoder", True),
+        },
+        "metrics": {name: value / n for name, value in sorted(totals.items())},
+        # Stage seconds are summed over worker threads, so with workers > 1 they
+        # can add up to more than the wall time
+        "stage_ms_per_query": {name: timings.get(name, 0.0) * 1000 / n for name in STAGES},
+        "batch_ms_p50": float(np.percentile(batch_seconds, 50) * 1000) if batch_seconds else 0.0,
+        "batch_ms_max": float(max(batch_seconds) * 1000) if batch_seconds else 0.0,
+        "wall_seconds": wall,
+        "ms_per_query": wall * 1000 / n,
+        "queries_per_second": len(queries) / wall if wall > 0 else 0.0,
+    }
+
+def print_report(report):
+    ks = report["k"]
+    metrics = report["metrics"]
+    print(f"\nEvaluated {report['queries']} queries from {report['dataset']}")
+    print(f"{'K':>4} {'Recall':>8} {'HitRate':>8} {'MAP':>8} {'nDCG':>8}")
+    for k in ks:
+        print(f"{k:>4} {metrics[f'recall@{k}']:>8.4f} {metrics[f'hit@{k}']:>8.4f} "
+              f"{metrics[f'map@{k}']:>8.4f} {metrics[f'ndcg@{k}']:>8.4f}")
+    print(f"MRR@{max(ks)}: {metrics['mrr']:.4f}, test types covered@{max(ks)}: {metrics[f'types@{max(ks)}']:.2f}")
+    stages = ", ".join(f"{name} {ms:.3f}" for name, ms in report["stage_ms_per_query"].items())
+    print(f"Stage ms/query: {stages}")
+    print(f"Throughput: {report['queries_per_second']:.1f} queries/s ({report['ms_per_query']:.3f} ms/query, "
+          f"{report['wall_seconds']:.2f} s total)")
+
 def calculate_recall_at_k(engine, k=10):
+    """Mean Recall@k over every query in TRAIN_FILE."""
     if not os.path.exists(TRAIN_FILE):
         print(f"Error: {TRAIN_FILE} not found.")
         return 0.0
 
-    df = pd.read_csv(TRAIN_FILE)
-    
-    # Ensure expected columns exist
-    if 'Query' not in df.columns or 'Assessment_url' not in df.columns:
-        print(f"Error: {TRAIN_FILE} must have 'Query' and 'Assessment_url' columns.")
-        return 0.0
+    report = evaluate(engine, ks=(k,))
+    print(f"Mean Recall@{k} over {report['queries']} queries: {report['metrics'][f'recall@{k}']:.4f}")
+    return report["metrics"][f"recall@{k}"]
 
-    print(f"Loading training data from {TRAIN_FILE}...")
-    
-    # Group by Query because one query might have multiple relevant assessments?
-    # In this dataset, it looks like 1-to-1 or 1-to-many. 
-    # Let's verify recall: For each unique query, did we find the relevant URL in top K?
-    
-    hits = 0
-    total_queries = 0
-    
-    unique_queries = df['Query'].unique()
-    
-    # Optimization: Loading engine is done outside loop
-    
-    for query in unique_queries[:50]: # Limit to 50 for quick evaluation check
-        relevant_urls = df[df['Query'] == query]['Assessment_url'].tolist()
-        normalized_relevant = [normalize_url(u) for u in relevant_urls]
-        
-        # Get recommendations
-        # Note: Engine logic has changed to return dicts
-        results = engine.search(query, limit=k)
-        
-        top_k_urls = [r['assessment_url'] for r in results]
-        normalized_top_k = [normalize_url(u) for u in top_k_urls]
-        
-        # Check if ANY relevant URL is in the Top K
-        match = any(u in normalized_top_k for u in normalized_relevant)
-        
-        if match:
-            hits += 1
-        else:
-            # Debugging - print first miss
-             if total_queries == 0:
-                 pass
-                 # print(f"Miss for '{query}': Expected {normalized_relevant}, Got {normalized_top_k}")
-
-        total_queries += 1
-        
-    if total_queries == 0:
-        return 0.0
-        
-    recall = hits / total_queries
-    print(f"Evaluating on {total_queries} unique queries...")
-    print(f"\nMean Recall@{k}: {recall:.4f}")
-    return recall
+def index_recall_report(engine, k=10, n_probes=(1, 2, 4, 8, 16)):
+    """
+    Compare the IVF index against exact search on the train queries: overlap with
+    the exact top-K (neighbour recall), ground-truth Recall@K and search latency.
+    """
+    from index import ExactIndex, IVFIndex
+
+    if not os.path.exists(TRAIN_FILE) or engine.embedding_matrix is None:
+        print("Error: train data and a loaded engine are required for the index report.")
+        return []
+
+    queries = list(pd.read_csv(TRAIN_FILE)['Query'].unique())
+    query_embeddings = engine._encode(queries)
+
+    exact = ExactIndex(engine.embedding_matrix)
+    exact_top, _ = exact.search(query_embeddings, k)
+    ivf = IVFIndex(engine.embedding_matrix).build()
+
+    original_index = engine.index
+    report = []
+    try:
+        configs = [("exact", None, exact)] + [("ivf", p, ivf) for p in n_probes]
+        for name, n_probe, index in configs:
+            if n_probe is not None:
+                index.n_probe = n_probe
+            start = time.perf_counter()
+            top, _ = index.search(query_embeddings, k)
+            ms = (time.perf_counter() - start) / len(queries) * 1000
+            overlap = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(top, exact_top)])
+
+            engine.index = index
+            recall = calculate_recall_at_k(engine, k)
+            report.append({"index": name, "n_probe": n_probe, "neighbour_recall": overlap,
+                           f"recall@{k}": recall, "ms_per_query": ms})
+    finally:
+        engine.index = original_index
+
+    print(f"\n{'index':<6} {'n_probe':>7} {'overlap@'+str(k):>11} {'Recall@'+str(k):>10} {'ms/query':>9}")
+    for row in report:
+        print(f"{row['index']:<6} {str(row['n_probe'] or '-'):>7} {row['neighbour_recall']:>11.4f} "
+              f"{row[f'recall@{k}']:>10.4f} {row['ms_per_query']:>9.3f}")
+    return report
+
+RERANK_CONFIGS = [
+    ("no balance", {"balance": False}),
+    ("balance (default)", {}),
+    ("mmr 0.7", {"mmr_lambda": 0.7}),
+    ("mmr 0.5", {"mmr_lambda": 0.5}),
+    ("quota K<=4", {"type_quotas": {"K": 4}}),
+    ("mmr 0.7 + quota", {"mmr_lambda": 0.7, "type_quotas": {"K": 4}}),
+]
+
+def rerank_report(engine, k=10, configs=RERANK_CONFIGS):
+    """Quality, diversity and re-ranking cost of each rerank configuration on the labelled queries."""
+    rows = []
+    for name, options in configs:
+        report = evaluate(engine, ks=(k,), rerank=options)
+        rows.append((name, report))
+
+    print(f"\n{'rerank':<20} {'Recall@'+str(k):>10} {'MAP@'+str(k):>8} {'nDCG@'+str(k):>8} {'types@'+str(k):>8} {'rerank ms/q':>12}")
+    for name, report in rows:
+        m = report["metrics"]
+        print(f"{name:<20} {m[f'recall@{k}']:>10.4f} {m[f'map@{k}']:>8.4f} {m[f'ndcg@{k}']:>8.4f} "
+              f"{m[f'types@{k}']:>8.2f} {report['stage_ms_per_query']['rerank']:>12.4f}")
+    return {name: report for name, report in rows}
+
+def cross_encoder_report(engine, k=10, budgets=(0, 200, 50, 10), backend=None):
+    """
+    Quality lift and added latency of the cross-encoder stage: the default
+    ranking against cross-encoder re-scoring with each latency budget
+    (ms, 0 = unlimited). Loads the cross-encoder if the engine has none.
+    """
+    from cross_encoder import CROSS_ENCODER
+
+    engine._load_cross_encoder(backend or CROSS_ENCODER or "torch")
+    configs = [("off", {"cross_encoder": False})]
+    configs += [(f"budget {b} ms" if b else "unlimited", {"cross_encoder": True, "budget_ms": b}) for b in budgets]
+
+    rows = []
+    for name, options in configs:
+        passes = dict(engine.cross_reranker.passes)
+        report = evaluate(engine, ks=(k,), rerank=options)
+        report["cross_passes"] = {o: engine.cross_reranker.passes[o] - passes[o] for o in passes}
+        rows.append((name, report))
+
+    base = rows[0][1]
+    print(f"\n{'cross-encoder':<16} {'Recall@'+str(k):>10} {'MAP@'+str(k):>8} {'nDCG@'+str(k):>8} "
+          f"{'cross ms/q':>11} {'+ms/q':>8} {'passes full/reduced/skipped':>28}")
+    for name, report in rows:
+        m = report["metrics"]
+        added = report["ms_per_query"] - base["ms_per_query"]
+        passes = "/".join(str(report["cross_passes"][o]) for o in ("full", "reduced", "skipped"))
+        print(f"{name:<16} {m[f'recall@{k}']:>10.4f} {m[f'map@{k}']:>8.4f} {m[f'ndcg@{k}']:>8.4f} "
+              f"{report['stage_ms_per_query']['cross']:>11.3f} {added:>+8.3f} {passes:>28}")
+    return {name: report for name, report in rows}
+
+def hybrid_report(engine, k=10):
+    """Recall@K with dense-only vs hybrid (dense + BM25) retrieval, and the added latency per query."""
+    from bm25 import BM25Index
+    from engine import build_corpus_text
+
+    if not os.path.exists(TRAIN_FILE) or engine.embedding_matrix is None:
+        print("Error: train data and a loaded engine are required for the hybrid report.")
+        return {}
+
+    original = engine.snapshot
+    bm25 = original.bm25 or BM25Index([build_corpus_text(item) for item in original.assessments])
+    report = {}
+    try:
+        for name, lexical in (("dense", None), ("hybrid", bm25)):
+            engine.snapshot = original._replace(bm25=lexical)
+            engine.clear_results()
+            report[f"{name}_recall@{k}"] = calculate_recall_at_k(engine, k)
+
+        # Cost of the lexical stage alone: BM25 scoring + fusion on top of the dense pool
+        queries = list(pd.read_csv(TRAIN_FILE)['Query'].unique())
+        query_embeddings = engine._encode(queries)
+        dense_top, dense_scores = original.index.search(query_embeddings, 30)
+        start = time.perf_counter()
+        for query, emb, idx, scores in zip(queries, query_embeddings, dense_top, dense_scores):
+            engine._fuse_lexical(
+                engine.snapshot, query, idx, scores, None,
+                lambda rows, emb=emb: engine.embedding_matrix.score_rows(emb, rows),
+            )
+        report["added_ms_per_query"] = (time.perf_counter() - start) / len(queries) * 1000
+    finally:
+        engine.snapshot = original
+        engine.clear_results()
+
+    print(f"\nDense  Recall@{k}: {report[f'dense_recall@{k}']:.4f}")
+    print(f"Hybrid Recall@{k}: {report[f'hybrid_recall@{k}']:.4f}")
+    print(f"Added latency (BM25 + fusion): {report['added_ms_per_query']:.3f} ms/query")
+    return report
+
+# The same need as clients phrase it: case, spacing, request boilerplate around
+# the query, and a rewording that only near-duplicate detection can match
+QUERY_VARIANTS = [
+    lambda q: q,
+    lambda q: q.upper(),
+    lambda q: "  " + q.replace(" ", "  ") + "\n",
+    lambda q: f"I am hiring for {q}",
+    lambda q: f"Hi, can you recommend some assessments? {q} Thanks!",
+    lambda q: f"Assessments needed: {q}",
+]
+
+DEDUP_MODES = [
+    # name, normalize boilerplate, near-duplicate reuse, caches on
+    ("no reuse", False, False, False),
+    ("case/space", False, False, True),
+    ("normalized", True, False, True),
+    ("normalized + near-dup", True, True, True),
+]
+
+def dedup_report(engine, k=10, paths=(TRAIN_FILE, TEST_FILE), variants=QUERY_VARIANTS):
+    """
+    Cache reuse from query normalization and near-duplicate detection
+    (query_norm.py). Every query of each file is sent in each of `variants`,
+    one search at a time as a stream of requests, once per mode in
+    DEDUP_MODES. Reports result reuse (exact cache and near-duplicate hits),
+    texts encoded and encode seconds saved against no reuse, and Recall@k
+    where the file has labels.
+    """
+    import query_norm
+    from cache import LRUCache
+
+    if engine.embedding_matrix is None:
+        print("Error: a loaded engine is required for the dedup report.")
+        return {}
+
+    calls = {"texts": 0, "seconds": 0.0}
+    encode = engine._encode
+    def counted_encode(texts, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return encode(texts, *args, **kwargs)
+        finally:
+            calls["texts"] += len(texts)
+            calls["seconds"] += time.perf_counter() - start
+
+    saved = (query_norm.QUERY_NORMALIZE, engine.dedup_threshold, engine.query_cache, engine.result_cache)
+    report = {}
+    engine._encode = counted_encode
+    try:
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"Skipping {path}: not found.")
+                continue
+            data = pd.read_csv(path)
+            truth = load_ground_truth(path) if "Assessment_url" in data.columns else None
+            queries = list(data["Query"].dropna().unique())
+            stream = [(q, variant(q)) for variant in variants for q in queries]
+
+            rows = []
+            for name, normalize, near_dup, caches in DEDUP_MODES:
+                query_norm.QUERY_NORMALIZE = normalize
+                engine.dedup_threshold = saved[1] if near_dup else 0
+                engine.query_cache = LRUCache(saved[2].maxsize if caches else 0)
+                engine.result_cache = LRUCache(saved[3].maxsize if caches else 0)
+                engine.recent_queries = {}
+                calls.update(texts=0, seconds=0.0)
+
+                start = time.perf_counter()
+                results = [engine.search(text, limit=k) for _, text in stream]
+                seconds = time.perf_counter() - start
+                near = sum(recent.matches for recent in engine.recent_queries.values())
+                row = {
+                    "mode": name,
+                    "searches": len(stream),
+                    "exact_hits": engine.result_cache.hits,
+                    "near_hits": near,
+                    "hit_rate": (engine.result_cache.hits + near) / len(stream),
+                    "texts_encoded": calls["texts"],
+                    "encode_seconds": calls["seconds"],
+                    "ms_per_query": seconds / len(stream) * 1000,
+                }
+                if truth is not None:
+                    recalls = [ranking_metrics([normalize_url(r["assessment_url"]) for r in found], truth[q], (k,))
+                               for (q, _), found in zip(stream, results)]
+                    row[f"recall@{k}"] = float(np.mean([m[f"recall@{k}"] for m in recalls]))
+                rows.append(row)
+            for row in rows:
+                row["encode_seconds_saved"] = rows[0]["encode_seconds"] - row["encode_seconds"]
+            report[os.path.basename(path)] = rows
+    finally:
+        del engine._encode
+        query_norm.QUERY_NORMALIZE, engine.dedup_threshold, engine.query_cache, engine.result_cache = saved
+        engine.recent_queries = {}
+
+    for name, rows in report.items():
+        print(f"\n{name}: {rows[0]['searches']} searches, {len(variants)} phrasings per query")
+        print(f"{'mode':<22} {'exact':>6} {'near':>5} {'hit rate':>9} {'encoded':>8} {'encode s':>9} "
+              f"{'saved s':>8} {'ms/q':>7} {'Recall@'+str(k):>10}")
+        for row in rows:
+            recall = row.get(f"recall@{k}")
+            print(f"{row['mode']:<22} {row['exact_hits']:>6} {row['near_hits']:>5} {row['hit_rate']:>9.2%} "
+                  f"{row['texts_encoded']:>8} {row['encode_seconds']:>9.3f} {row['encode_seconds_saved']:>8.3f} "
+                  f"{row['ms_per_query']:>7.2f} {'-' if recall is None else f'{recall:.4f}':>10}")
+    return report
 
 if __name__ == "__main__":
-    calculate_recall_at_k(engine, K)
+    parser = argparse.ArgumentParser(description="Evaluate recommendation quality and speed on labelled queries.")
+    parser.add_argument("--data", default=None, help="CSV with Query and Assessment_url columns")
+    parser.add_argument("--k", default="1,3,5,10", help="comma-separated cutoffs")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1, help="threads searching batches in parallel")
+    parser.add_argument("--model", default=None, help="loaded model to evaluate (see SHL_MODELS)")
+    parser.add_argument("--json", metavar="PATH", help="write the full report as JSON")
+    parser.add_argument("--index-report", action="store_true", help="compare IVF against exact search")
+    parser.add_argument("--hybrid-report", action="store_true", help="compare dense-only and hybrid retrieval")
+    parser.add_argument("--rerank-report", action="store_true", help="compare re-ranking configurations")
+    parser.add_argument("--cross-encoder-report", action="store_true",
+                        help="quality lift and latency of cross-encoder re-scoring at several budgets")
+    parser.add_argument("--dedup-report", action="store_true",
+                        help="cache reuse from query normalization and near-duplicate detection on train/test")
+    args = parser.parse_args()
+
+    from engine import engine
+    if args.index_report:
+        index_recall_report(engine, K)
+    elif args.hybrid_report:
+        hybrid_report(engine, K)
+    elif args.rerank_report:
+        rerank_report(engine, K)
+    elif args.cross_encoder_report:
+        cross_encoder_report(engine, K)
+    elif args.dedup_report:
+        dedup_report(engine, K)
+    else:
+        report = evaluate(engine, ks=[int(k) for k in args.k.split(",")], path=args.data,
+                          batch_size=args.batch_size, workers=args.workers, model=args.model)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.json}")
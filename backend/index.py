@@ -0,0 +1,176 @@
+import os
+import numpy as np
+from scoring import top_k
+from timing import stage
+
+# Nearest-neighbour indexes over an EmbeddingMatrix. Both backends return
+# (indices, scores) arrays of the k best catalog rows, best first, so the engine
+# builds the same candidate pool whichever one is configured.
+#
+# An optional boolean `mask` (one row per query, or one shared row) restricts
+# the search to qualifying items. When fewer than k items qualify the result is
+# padded with -inf scores, which callers drop. Passing a `timings` dict records
+# the time spent scoring and selecting the top k (see timing.py).
+
+INDEX_BACKENDS = ("exact", "ivf")
+
+class ExactIndex:
+    """Brute-force search: score every catalog row."""
+    name = "exact"
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, queries, k, mask=None, timings=None):
+        """`queries` is one normalized vector or a (n, dim) batch."""
+        with stage(timings, "score"):
+            scores = self.matrix.score(queries)
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+        with stage(timings, "topk"):
+            top = top_k(scores, k)
+            return top, np.take_along_axis(scores, top, axis=-1)
+
+    def save(self, path):
+        pass
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are clustered with spherical k-means and a query
+    only scores the rows in its `n_probe` closest clusters. Lists are stored
+    CSR-style (`list_offsets` into `list_rows`) so probing is a slice per list.
+    """
+    name = "ivf"
+
+    def __init__(self, matrix, n_lists=None, n_probe=8, n_iter=10, sample_size=50_000, seed=0):
+        self.matrix = matrix
+        self.n_probe = n_probe
+        self.centroids = None
+        self.list_offsets = None
+        self.list_rows = None
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(matrix))))
+        self.n_lists = min(n_lists, max(1, len(matrix)))
+        self._n_iter = n_iter
+        self._sample_size = sample_size
+        self._seed = seed
+
+    def build(self):
+        n = len(self.matrix)
+        rng = np.random.default_rng(self._seed)
+        sample_rows = np.sort(rng.choice(n, size=min(n, self._sample_size), replace=False))
+        sample = self.matrix.dense(sample_rows)
+
+        centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)]
+        for _ in range(self._n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=self.n_lists) == 0
+            # Re-seed empty clusters with random sample points
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        self.centroids = centroids.astype(np.float32)
+        self._assign_all()
+        return self
+
+    def _assign_all(self):
+        n = len(self.matrix)
+        assign = np.empty(n, dtype=np.int32)
+        chunk = 16384
+        for start in range(0, n, chunk):
+            rows = np.arange(start, min(start + chunk, n))
+            assign[rows] = np.argmax(self.matrix.dense(rows) @ self.centroids.T, axis=1)
+        self.list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=self.n_lists)))).astype(np.int64)
+
+    def _probe(self, query, k, mask=None):
+        """Catalog rows in the closest lists: at least n_probe lists and k qualifying rows."""
+        order = np.argsort(-(self.centroids @ query))
+        rows, count = [], 0
+        for i, lst in enumerate(order):
+            start, end = self.list_offsets[lst], self.list_offsets[lst + 1]
+            if end > start:
+                members = self.list_rows[start:end]
+                if mask is not None:
+                    members = members[mask[members]]
+                rows.append(members)
+                count += len(members)
+            if i + 1 >= self.n_probe and count >= k:
+                break
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def _search_one(self, query, k, mask=None, timings=None):
+        with stage(timings, "score"):
+            rows = self._probe(query, k, mask)
+            scores = self.matrix.score_rows(query, rows)
+        with stage(timings, "topk"):
+            top = top_k(scores, k)
+            return rows[top], scores[top]
+
+    def search(self, queries, k, mask=None, timings=None):
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            return self._search_one(queries, k, mask, timings)
+
+        k = min(k, len(self.matrix))
+        indices = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            row_mask = mask if mask is None or mask.ndim == 1 else mask[i]
+            found, found_scores = self._search_one(query, k, row_mask, timings)
+            indices[i, :len(found)] = found
+            scores[i, :len(found)] = found_scores
+        return indices, scores
+
+    def save(self, path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        with np.load(path) as data:
+            if data["list_rows"].shape[0] != len(self.matrix):
+                raise ValueError(f"{path} does not match the catalog size")
+            self.centroids = data["centroids"]
+            self.list_offsets = data["list_offsets"]
+            self.list_rows = data["list_rows"]
+        self.n_lists = len(self.centroids)
+        return self
+
+def build_index(backend, matrix, path=None, n_lists=None, n_probe=8, previous=None):
+    """
+    Build (or load from `path`) the configured index over `matrix`.
+    The IVF lists are persisted at `path` so later starts skip k-means. Passing
+    the `previous` IVF index (e.g. on a catalog reload) reuses its centroids and
+    only reassigns rows to lists.
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend {backend!r}, expected one of {INDEX_BACKENDS}")
+    if backend == "exact" or len(matrix) == 0:
+        return ExactIndex(matrix)
+
+    index = IVFIndex(matrix, n_lists=n_lists, n_probe=n_probe)
+    if path and os.path.exists(path):
+        try:
+            return index.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: ignoring index file {path}: {e}")
+
+    if isinstance(previous, IVFIndex) and previous.centroids is not None:
+        index.centroids = previous.centroids
+        index.n_lists = len(previous.centroids)
+        index._assign_all()
+    else:
+        print(f"Building IVF index ({index.n_lists} lists)...")
+        index.build()
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Warning: could not save index to {path}: {e}")
+    return index
@@ -0,0 +1,152 @@
+import ipaddress
+import re
+import socket
+import time
+from urllib.parse import urljoin, urlsplit
+import numpy as np
+import requests
+from bs4 import BeautifulSoup
+from cache import LRUCache
+from scrape import HEADERS
+
+# Long job descriptions: splitting into chunks the encoder can see in full,
+# and fetching JD text from a URL.
+
+# Queries longer than this many words are encoded chunk by chunk. MiniLM
+# truncates at 256 word pieces, roughly 180 English words.
+JD_MIN_WORDS = 120
+CHUNK_WORDS = 100
+
+FETCH_TIMEOUT = 5.0          # seconds, for the whole fetch
+FETCH_MAX_BYTES = 2_000_000
+FETCH_CACHE_SIZE = 256
+FETCH_CACHE_TTL = 3600
+FETCH_MAX_REDIRECTS = 5
+FETCH_CONTENT_TYPES = ("text/html", "text/plain")
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+def is_long_text(text):
+    return len(str(text).split()) > JD_MIN_WORDS
+
+def chunk_text(text, max_words=CHUNK_WORDS):
+    """
+    Split text into chunks of whole sentences of at most `max_words` words.
+    Sentences longer than that are cut into `max_words` windows.
+    """
+    chunks, current = [], []
+    for sentence in _SENTENCE_RE.split(str(text)):
+        words = sentence.split()
+        if not words:
+            continue
+        if len(words) > max_words:
+            if current:
+                chunks.append(" ".join(current))
+                current = []
+            for start in range(0, len(words), max_words):
+                chunks.append(" ".join(words[start:start + max_words]))
+            continue
+        if len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def pool_scores(scores, pooling="max"):
+    """
+    Collapse (n_chunks, n_items) chunk scores to one score per item.
+    `pooling` is "max", "mean" or "topN" (mean of each item's N best chunks).
+    """
+    if pooling == "max" or len(scores) == 1:
+        return scores.max(axis=0)
+    if pooling == "mean":
+        return scores.mean(axis=0)
+    match = re.fullmatch(r"top(\d+)", pooling)
+    if not match:
+        raise ValueError(f"Unknown pooling {pooling!r}, expected max, mean or topN")
+    n = min(int(match.group(1)), len(scores))
+    best = np.partition(scores, len(scores) - n, axis=0)[len(scores) - n:]
+    return best.mean(axis=0)
+
+_fetch_cache = LRUCache(FETCH_CACHE_SIZE, FETCH_CACHE_TTL)
+
+def check_public_url(url):
+    """
+    Raise ValueError unless `url` is http(s) and its host resolves only to
+    public addresses: URLs come from clients, and the server must not be made
+    to fetch loopback, private, link-local or metadata addresses (its own
+    /admin routes included).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Only http(s) URLs can be fetched: {url}")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not resolve {parts.hostname}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"{parts.hostname} resolves to a non-public address ({address})")
+
+def fetch_jd_text(url, timeout=FETCH_TIMEOUT):
+    """
+    Visible text of the HTML or plain-text page at `url`. Only public http(s)
+    addresses are fetched, redirects included (see check_public_url). The
+    connect and every read wait at most the time left of `timeout`, and the
+    body stops at FETCH_MAX_BYTES; recent URLs are served from a cache.
+    Raises ValueError when the page can't be fetched in full within `timeout`.
+    """
+    cached = _fetch_cache.get(url)
+    if cached is not None:
+        return cached
+
+    deadline = time.monotonic() + timeout
+    location = url
+    try:
+        # Redirects are followed here so every hop is checked
+        for _ in range(FETCH_MAX_REDIRECTS + 1):
+            check_public_url(location)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ValueError(f"Timed out fetching {url}")
+            response = requests.get(location, headers=HEADERS, timeout=(remaining, remaining), stream=True,
+                                    allow_redirects=False)
+            if not response.is_redirect:
+                break
+            response.close()
+            location = urljoin(location, response.headers["location"])
+        else:
+            raise ValueError(f"Too many redirects fetching {url}")
+
+        with response:
+            if response.status_code != 200:
+                raise ValueError(f"{url} returned HTTP {response.status_code}")
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type not in FETCH_CONTENT_TYPES:
+                raise ValueError(f"{url} is not an HTML or text page ({content_type or 'no content type'})")
+            body = bytearray()
+            # read1 returns what one socket read delivers, so the deadline is checked between reads
+            read = getattr(response.raw, "read1", None) or response.raw.read
+            while len(body) <= FETCH_MAX_BYTES:
+                if time.monotonic() >= deadline:
+                    raise ValueError(f"Timed out fetching {url}")
+                block = read(65536, decode_content=True)
+                if not block:
+                    break
+                body.extend(block)
+    except requests.RequestException as e:
+        raise ValueError(f"Could not fetch {url}: {e}")
+
+    soup = BeautifulSoup(bytes(body), "html.parser")
+    for tag in soup(["script", "style", "noscript", "header", "footer", "nav"]):
+        tag.decompose()
+    lines = (" ".join(line.split()) for line in soup.get_text(separator="\n").splitlines())
+    text = "\n".join(line for line in lines if line)
+    _fetch_cache.put(url, text)
+    return text
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import time
+import numpy as np
+import httpx
+
+# Concurrent load test for /recommend. Runs against a live server (--url) or
+# in-process through the ASGI app, and reports throughput and p50/p99 latency.
+
+QUERIES = [
+    "Java developer who can collaborate with business teams",
+    "Sales manager with strong communication skills",
+    "Entry level accounts payable clerk",
+    "Python, SQL and JavaScript developer",
+    "Customer service representative for a call centre",
+    "Senior data analyst with Excel and Tableau",
+    "Team lead for a software engineering group",
+    "Administrative assistant with MS Office skills",
+]
+
+async def wait_ready(client, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        health = (await client.get("/health")).json()
+        if health["status"] == "ready":
+            return
+        if health["status"] == "error":
+            raise RuntimeError(f"Engine failed to load: {health.get('error')}")
+        await asyncio.sleep(0.2)
+    raise TimeoutError("Engine did not become ready")
+
+async def run_load(client, concurrency, total):
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            payload = {"query": QUERIES[i % len(QUERIES)]}
+            start = time.perf_counter()
+            response = await client.post("/recommend", json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return elapsed, np.array(latencies) * 1000
+
+async def main(args):
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            await wait_ready(client)
+            elapsed, latencies = await run_load(client, args.concurrency, args.requests)
+            health = (await client.get("/health")).json()
+    else:
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+                await wait_ready(client)
+                elapsed, latencies = await run_load(client, args.concurrency, args.requests)
+                health = (await client.get("/health")).json()
+
+    print(f"requests:    {len(latencies)} at concurrency {args.concurrency}")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50: {np.percentile(latencies, 50):.1f} ms")
+    print(f"latency p99: {np.percentile(latencies, 99):.1f} ms")
+    if "batching" in health:
+        print(f"batching:    {health['batching']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test for /recommend")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process app)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -1,10 +1,110 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hmac
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-from engine import engine
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
+from batcher import MicroBatcher
+from catalog import TEST_TYPE_KEYS
+from engine import DATA_FILE, get_engine
+from jd import fetch_jd_text
+import metrics
+from profiler import PROFILE_AT_START, profiler
+from shared_snapshot import current_version
+from timing import stage
 
-app = FastAPI(title="SHL Assessment Recommender")
+# Micro-batching of /recommend: max queries per batch and how long the first
+# request in a batch may wait for others. A batch size of 1 disables batching.
+BATCH_MAX_SIZE = int(os.environ.get("SHL_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("SHL_BATCH_MAX_WAIT_MS", "5"))
+
+# Set SHL_WATCH_CATALOG=1 to reload the catalog automatically when the data
+# file changes (polled every SHL_WATCH_INTERVAL seconds).
+WATCH_CATALOG = os.environ.get("SHL_WATCH_CATALOG", "0") == "1"
+WATCH_INTERVAL = float(os.environ.get("SHL_WATCH_INTERVAL", "2"))
+
+# Set by serve.py for its workers: the directory where the parent process
+# publishes the loaded catalog. Workers attach to it instead of loading their own.
+SHARED_SNAPSHOT = os.environ.get("SHL_SHARED_SNAPSHOT")
+
+# /admin endpoints need "Authorization: Bearer <SHL_ADMIN_TOKEN>"; without the
+# variable set they are disabled (404).
+ADMIN_TOKEN = os.environ.get("SHL_ADMIN_TOKEN")
+
+# Set SHL_SERVER_TIMING=1 to send each /recommend's stage durations back in a
+# Server-Timing header (shown by browser dev tools). Needs metrics enabled.
+SERVER_TIMING = os.environ.get("SHL_SERVER_TIMING", "0") == "1"
+
+# The engine is loaded by a background task after the server starts, so the
+# port is bound immediately and /recommend answers 503 until it is ready.
+engine = get_engine(load=False)
+batcher = MicroBatcher(engine, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+async def load_engine():
+    if engine.state == "ready":
+        return
+    try:
+        if SHARED_SNAPSHOT:
+            await asyncio.to_thread(engine.attach_shared, SHARED_SNAPSHOT)
+        else:
+            await asyncio.to_thread(engine.load_data)
+    except Exception as e:
+        print(f"Error: engine failed to load: {e}")
+
+def catalog_mtime():
+    try:
+        return os.stat(DATA_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+async def watch_shared_snapshot():
+    while True:
+        await asyncio.sleep(WATCH_INTERVAL)
+        if engine.state != "ready" or current_version(SHARED_SNAPSHOT) == engine.shared_version:
+            continue
+        try:
+            await asyncio.to_thread(engine.reload_data)
+        except Exception as e:
+            # Still serving the previous version; retried on the next poll
+            print(f"Error: attaching the new shared snapshot failed, keeping version {engine.shared_version}: {e}")
+
+async def watch_catalog():
+    last = catalog_mtime()
+    while True:
+        await asyncio.sleep(WATCH_INTERVAL)
+        current = catalog_mtime()
+        if current == last or engine.state != "ready":
+            continue
+        last = current
+        try:
+            await asyncio.to_thread(engine.reload_data)
+        except Exception as e:
+            print(f"Error: catalog reload failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(load_engine())]
+    if SHARED_SNAPSHOT:
+        # The parent watches the catalog and republishes; workers follow it
+        tasks.append(asyncio.create_task(watch_shared_snapshot()))
+    elif WATCH_CATALOG:
+        tasks.append(asyncio.create_task(watch_catalog()))
+    await batcher.start()
+    if PROFILE_AT_START:
+        profiler.start()
+    yield
+    profiler.stop()
+    await batcher.stop()
+    for task in tasks:
+        task.cancel()
+
+app = FastAPI(title="SHL Assessment Recommender", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -15,36 +115,189 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Invalid request bodies (unknown test types, bad quotas) are client errors like
+# the other rejected requests, so 400 rather than FastAPI's default 422
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    return JSONResponse(status_code=400, content={"detail": jsonable_encoder(exc.errors())})
+
+def check_test_type_keys(keys):
+    unknown = [key for key in keys if len(key) != 1 or key.upper() not in TEST_TYPE_KEYS]
+    if unknown:
+        raise ValueError(f"unknown test type keys {unknown}, expected one of {', '.join(TEST_TYPE_KEYS)}")
+
+class SearchFilters(BaseModel):
+    max_duration: Optional[int] = None
+    min_duration: Optional[int] = None
+    # SHL test type keys, e.g. ["K", "P"]
+    test_types: Optional[List[str]] = None
+    remote: Optional[bool] = None
+    adaptive: Optional[bool] = None
+
+    @field_validator("test_types")
+    @classmethod
+    def check_test_types(cls, test_types):
+        if test_types is None:
+            return test_types
+        check_test_type_keys(test_types)
+        return [key.upper() for key in test_types]
+
+class RerankOptions(BaseModel):
+    # MMR trade-off between relevance (1.0) and diversity; unset uses SHL_MMR_LAMBDA
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    # Max results per SHL test type key, e.g. {"K": 4, "P": 3}; each at least 1
+    type_quotas: Optional[Dict[str, int]] = None
+    # Interleave Hard and Soft skill assessments for mixed queries
+    balance: Optional[bool] = None
+    # Cross-encoder second stage (when SHL_CROSS_ENCODER is set): on/off, candidates
+    # re-scored per query and the time the pass may take in ms (0 = unlimited)
+    cross_encoder: Optional[bool] = None
+    cross_encoder_top_n: Optional[int] = Field(None, ge=1)
+    budget_ms: Optional[float] = Field(None, ge=0.0)
+
+    @field_validator("type_quotas")
+    @classmethod
+    def check_type_quotas(cls, quotas):
+        if quotas is None:
+            return quotas
+        check_test_type_keys(quotas)
+        if any(limit < 1 for limit in quotas.values()):
+            raise ValueError("type quotas must be at least 1")
+        return {key.upper(): limit for key, limit in quotas.items()}
+
 class QueryRequest(BaseModel):
     query: str
     url: Optional[str] = None
+    # Explicit constraints; duration limits stated in the query are also applied
+    filters: Optional[SearchFilters] = None
+    rerank: Optional[RerankOptions] = None
+    # One of the loaded models (see /health); unset uses the default model
+    model: Optional[str] = None
 
 class AssessmentResult(BaseModel):
     assessment_name: str
     assessment_url: str
+    # Cosine similarity to the query; results are ranked by fusion and re-ranking, not by this
     score: float
 
 @app.post("/recommend", response_model=List[AssessmentResult])
 async def recommend(request: QueryRequest):
-    # If URL is provided, we might want to scrape it. 
-    # For now, we'll treat the query as the primary input.
-    # If query is empty but URL is there, we'd need to fetch URL content.
-    # (Future task: fetch JD from URL)
-    
-    text = request.query
-    if not text and request.url:
-         # Placeholder for URL scraping
-         text = "JD content from " + request.url
-    
-    if not text:
+    start = time.perf_counter()
+    timings = {} if metrics.ENABLED else None
+    try:
+        hits = await find_hits(request, timings)
+        with stage(timings, "respond"):
+            # Built from pre-serialized fragments, so the response is not re-validated
+            # through AssessmentResult; the model still documents the schema
+            body = engine.to_json(hits)
+    except Exception as e:
+        metrics.REQUESTS.inc(str(getattr(e, "status_code", 500)))
+        raise
+
+    total = time.perf_counter() - start
+    metrics.REQUESTS.inc("200")
+    metrics.REQUEST_SECONDS.observe(total)
+    headers = None
+    if timings is not None:
+        metrics.observe_stages(timings)
+        if SERVER_TIMING:
+            headers = {"Server-Timing": metrics.server_timing(timings, total)}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def find_hits(request, timings):
+    text = request.query.strip()
+    if not text and not request.url:
         raise HTTPException(status_code=400, detail="Query or URL required")
+
+    if engine.state != "ready":
+        raise HTTPException(status_code=503, detail=f"Engine not ready ({engine.state})", headers={"Retry-After": "5"})
+
+    if request.model is not None and request.model not in engine.models:
+        raise HTTPException(status_code=400, detail=f"Unknown model {request.model!r}; available: {engine.models}")
+
+    if request.url:
+        # The fetched JD is usually long, so the engine encodes it in chunks
+        try:
+            with stage(timings, "fetch"):
+                jd_text = await asyncio.to_thread(fetch_jd_text, request.url)
+        except ValueError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        text = f"{text}\n{jd_text}".strip()
+        if not text:
+            raise HTTPException(status_code=400, detail=f"No text found at {request.url}")
         
-    results = engine.search(text)
-    return results
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else None
+    rerank = request.rerank.model_dump(exclude_none=True) if request.rerank else None
+    return await batcher.search(text, filters=filters, rerank=rerank, timings=timings, model=request.model)
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_catalog():
+    """Re-read the catalog, encoding only added or changed assessments."""
+    if engine.state != "ready":
+        raise HTTPException(status_code=503, detail=f"Engine not ready ({engine.state})")
+    try:
+        return await asyncio.to_thread(engine.reload_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+
+def process_memory():
+    """
+    Memory of this worker in MB. On Linux PSS splits shared pages (the mapped
+    catalog) between the processes using them, so it sums correctly across workers.
+    """
+    stats = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Pss", "Shared_Clean"):
+                    stats[key.lower() + "_mb"] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return stats
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "assessments_loaded": len(engine.assessments)}
+    return {
+        "status": engine.state,
+        "error": engine.error,
+        "assessments_loaded": len(engine.assessments),
+        "models": engine.models,
+        "batching": batcher.stats(),
+        "cache": engine.cache_stats(),
+        "process": process_memory(),
+        "profiler": profiler.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request, stage, candidate-pool, query-length and cache metrics of this process (Prometheus text format)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+class ProfilerToggle(BaseModel):
+    enabled: bool
+    interval_ms: Optional[float] = Field(default=None, gt=0)
+
+@app.post("/admin/profiler", dependencies=[Depends(require_admin)])
+def toggle_profiler(toggle: ProfilerToggle):
+    """Start (clearing earlier samples) or stop the sampling profiler."""
+    if toggle.enabled:
+        profiler.start(toggle.interval_ms)
+    else:
+        profiler.stop()
+    return profiler.stats()
+
+@app.get("/admin/profiler", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+def profiler_samples(limit: Optional[int] = None):
+    """Sampled stacks in collapsed format (for flamegraph.pl or speedscope), most frequent first."""
+    return PlainTextResponse(profiler.collapsed(limit))
 
 if __name__ == "__main__":
     import uvicorn
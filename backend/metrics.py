@@ -0,0 +1,126 @@
+import bisect
+import os
+import threading
+
+# In-process metrics for the serving path, rendered in the Prometheus text
+# exposition format by GET /metrics. Only what we need: counters and
+# histograms with at most one label, each update a bisect and a locked add.
+#
+# Every process keeps its own values; with several workers (serve.py) each one
+# reports its own numbers, so scrape the workers individually or sum them.
+#
+# Set SHL_METRICS=0 to turn recording off (the endpoint then has no samples).
+
+ENABLED = os.environ.get("SHL_METRICS", "1") == "1"
+
+# Seconds, from 0.1 ms (cached lookups, re-ranking) up to model-bound requests
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Counter:
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value=None, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_value, value in sorted(values.items(), key=lambda kv: str(kv[0])):
+            lines.append(f"{self.name}{_labels(self.label, label_value)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, buckets, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [count per bucket ..., count above the last bucket, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        if not ENABLED:
+            return
+        # Buckets are upper bounds, inclusive ("le")
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            all_series = {k: list(v) for k, v in self._series.items()}
+        for label_value, series in sorted(all_series.items(), key=lambda kv: str(kv[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.label, label_value, le=le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label, label_value)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label, label_value)} {cumulative}")
+        return lines
+
+def _labels(label, value, **extra):
+    pairs = ([(label, value)] if label and value is not None else []) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+REQUEST_SECONDS = Histogram("shl_request_seconds", "Time to answer /recommend", LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram(
+    "shl_stage_seconds", "Time per /recommend stage (fetch, queue, encode, score, topk, fuse, cross, rerank, respond)",
+    LATENCY_BUCKETS, label="stage",
+)
+CANDIDATE_POOL_SIZE = Histogram(
+    "shl_candidate_pool_size", "Candidates handed to re-ranking per search", (0, 5, 10, 15, 20, 25, 30, 40, 60),
+)
+QUERY_TOKENS = Histogram(
+    "shl_query_tokens", "Whitespace tokens per search query", (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+RESULT_CACHE = Counter("shl_result_cache_lookups_total", "Result cache lookups by outcome", label="result")
+REQUESTS = Counter("shl_requests_total", "/recommend responses by status code", label="status")
+CROSS_ENCODER_PASSES = Counter(
+    "shl_cross_encoder_passes_total", "Cross-encoder passes by outcome (cut = reduced or skipped by the budget)",
+    label="outcome",
+)
+NEAR_DUPLICATES = Counter(
+    "shl_near_duplicate_hits_total", "Searches answered with the results of a near-duplicate recent query",
+)
+
+REGISTRY = [
+    REQUEST_SECONDS, STAGE_SECONDS, CANDIDATE_POOL_SIZE, QUERY_TOKENS, RESULT_CACHE, REQUESTS, CROSS_ENCODER_PASSES,
+    NEAR_DUPLICATES,
+]
+
+def observe_stages(timings):
+    """Record the stage seconds of one request (a timing.py timings dict)."""
+    for name, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, name)
+
+def render():
+    """All registered metrics in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def server_timing(timings, total=None):
+    """Server-Timing header value for a timings dict, durations in ms."""
+    parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
@@ -0,0 +1,207 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import engine as E
+from shared_snapshot import publish
+
+# Bulk predictions for a file of queries: the test set, or tens of thousands of
+# historical job postings. Queries are streamed from CSV or JSONL in chunks,
+# searched with engine.search_many (optionally in worker processes that attach
+# to one published snapshot, see shared_snapshot.py) and appended to the output
+# as each chunk finishes, so memory is bounded by the chunk size, not the file.
+#
+# Output formats:
+#   summary  Query,predictions       one row per query, "name (url) | ..." (validate.py)
+#   pairs    Query,Assessment_url    one row per recommendation (generate_predictions.py)
+#
+# After every chunk the output is flushed and a checkpoint next to it
+# (<output>.progress.json) records the input rows done and the output size. A
+# rerun with the same arguments truncates any half-written chunk and resumes.
+
+# Inputs and outputs default to the repo's data/ directory, wherever it is checked out
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+TEST_FILE = os.path.join(DATA_DIR, "test.csv")
+FORMATS = {
+    "summary": {"header": ["Query", "predictions"], "limit": 5},
+    "pairs": {"header": ["Query", "Assessment_url"], "limit": 10},
+}
+CHUNK_SIZE = 1024
+
+# Job postings can be longer than the csv module's default 128 KB field limit
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+def read_queries(path, column="Query"):
+    """Query texts from a CSV (column `column`) or JSONL file (objects with `column` or "query", or strings)."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    item = item.get(column, item.get("query", ""))
+                yield "" if item is None else str(item)
+        else:
+            reader = csv.DictReader(f)
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f"Column {column!r} not found in {path} (columns: {reader.fieldnames})")
+            for row in reader:
+                yield row[column] or ""
+
+def format_rows(fmt, query, results):
+    if fmt == "summary":
+        return [[query, " | ".join(f"{r['assessment_name']} ({r['assessment_url']})" for r in results)]]
+    return [[query, r["assessment_url"]] for r in results]
+
+def search_chunk(engine, queries, fmt, limit, batch_size=E.QUERY_BATCH_SIZE):
+    """Output rows for a chunk of queries. Blank queries are not searched (summary keeps their row)."""
+    texts = [q.strip() for q in queries]
+    found = iter(engine.search_many([t for t in texts if t], limit=limit, batch_size=batch_size))
+    rows = []
+    for query, text in zip(queries, texts):
+        rows.extend(format_rows(fmt, query, next(found) if text else []))
+    return rows
+
+# Worker processes: each attaches to the snapshot published by the parent
+_worker_engine = None
+
+def _init_worker(shared_dir, encoder_backend):
+    global _worker_engine
+    _worker_engine = E.RecommendationEngine(load=False, encoder_backend=encoder_backend)
+    _worker_engine.attach_shared(shared_dir)
+
+def _search_chunk_in_worker(queries, fmt, limit, batch_size):
+    return search_chunk(_worker_engine, queries, fmt, limit, batch_size)
+
+def load_progress(path, settings):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return progress if progress.get("settings") == settings else None
+
+def save_progress(path, settings, rows, size):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "rows": rows, "bytes": size}, f)
+    os.replace(tmp, path)
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def predict(input_path, output_path, fmt="summary", limit=None, column="Query", chunk_size=CHUNK_SIZE,
+            workers=1, batch_size=E.QUERY_BATCH_SIZE, fresh=False, shared_dir=None):
+    """Write predictions for every query in `input_path` to `output_path` (CSV in format `fmt`). Returns rows read."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {tuple(FORMATS)}")
+    limit = limit or FORMATS[fmt]["limit"]
+    settings = {"input": os.path.abspath(input_path), "format": fmt, "limit": limit, "column": column}
+    progress_path = f"{output_path}.progress.json"
+    progress = None if fresh else load_progress(progress_path, settings)
+
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+    if progress and os.path.exists(output_path):
+        done = progress["rows"]
+        # Drop anything written after the last checkpoint (a chunk cut off by a crash)
+        os.truncate(output_path, progress["bytes"])
+        out = open(output_path, "a", encoding="utf-8", newline="")
+        print(f"Resuming after {done} rows of {input_path}")
+    else:
+        done = 0
+        out = open(output_path, "w", encoding="utf-8", newline="")
+        csv.writer(out).writerow(FORMATS[fmt]["header"])
+    writer = csv.writer(out)
+
+    pool = None
+    private_dir = None
+    if workers > 1:
+        # Load and encode the catalog once; workers map it and only load the query encoder.
+        # Published to a private directory: the default shared one belongs to a running serve.py.
+        if shared_dir is None:
+            shared_dir = private_dir = tempfile.mkdtemp(prefix="shl-predict-")
+        engine = E.RecommendationEngine()
+        publish(engine.snapshot, shared_dir, engine.model_id)
+        # Spawned rather than forked: forking after the model is loaded can deadlock its thread pools
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(shared_dir, engine.encoder_backend))
+        del engine
+    else:
+        engine = E.get_engine()
+
+    def finish(rows, n):
+        nonlocal done
+        writer.writerows(rows)
+        out.flush()
+        os.fsync(out.fileno())
+        done += n
+        save_progress(progress_path, settings, done, os.fstat(out.fileno()).st_size)
+        rate = (done - start_rows) / max(time.perf_counter() - start, 1e-9)
+        print(f"{done} rows done ({rate:.1f} queries/s)")
+
+    start, start_rows = time.perf_counter(), done
+    try:
+        queries = chunks(islice(read_queries(input_path, column), done, None), chunk_size)
+        if pool is None:
+            for chunk in queries:
+                finish(search_chunk(engine, chunk, fmt, limit, batch_size), len(chunk))
+        else:
+            # Keep a few chunks per worker in flight and write them back in input order
+            in_flight = deque()
+            for chunk in queries:
+                in_flight.append((pool.submit(_search_chunk_in_worker, chunk, fmt, limit, batch_size), len(chunk)))
+                if len(in_flight) >= 2 * workers:
+                    future, n = in_flight.popleft()
+                    finish(future.result(), n)
+            while in_flight:
+                future, n = in_flight.popleft()
+                finish(future.result(), n)
+    finally:
+        out.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if private_dir is not None:
+            shutil.rmtree(private_dir, ignore_errors=True)
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print(f"Predictions for {done} queries saved to {output_path}")
+    return done
+
+def main(argv=None, **defaults):
+    parser = argparse.ArgumentParser(description="Stream bulk predictions for a CSV or JSONL file of queries")
+    parser.add_argument("input", nargs="?", default=defaults.get("input", TEST_FILE), help="CSV or JSONL of queries")
+    parser.add_argument("output", nargs="?", default=defaults.get("output"), help="CSV to write")
+    parser.add_argument("--format", choices=tuple(FORMATS), default=defaults.get("format", "summary"))
+    parser.add_argument("--limit", type=int, default=defaults.get("limit"), help="recommendations per query")
+    parser.add_argument("--column", default="Query", help="query column (CSV) or key (JSONL)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="queries read, searched and written at a time")
+    parser.add_argument("--batch-size", type=int, default=E.QUERY_BATCH_SIZE, help="queries per encoder pass")
+    parser.add_argument("--workers", type=int, default=1, help="search processes sharing one published snapshot")
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint of an interrupted run")
+    args = parser.parse_args(argv)
+    output = args.output or os.path.join(DATA_DIR, f"predictions_{args.format}.csv")
+    if not os.path.exists(args.input):
+        print(f"Input file {args.input} not found.")
+        return 1
+    predict(args.input, output, args.format, args.limit, args.column, args.chunk_size, args.workers,
+            args.batch_size, args.fresh)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
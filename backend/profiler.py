@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Sampling profiler that can be switched on and off in a running server
+# (POST /admin/profiler). A background thread snapshots every thread's stack
+# each `interval` seconds and counts identical stacks. Nothing runs in the
+# request path, so the cost is the sampler thread alone and stops with it.
+#
+# Output is the "collapsed" format (frames joined by ';' then a count), which
+# flamegraph.pl and speedscope read directly.
+#
+# Set SHL_PROFILE=1 to start sampling at boot (every SHL_PROFILE_INTERVAL_MS).
+
+PROFILE_AT_START = os.environ.get("SHL_PROFILE", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.environ.get("SHL_PROFILE_INTERVAL_MS", "5"))
+# Deeper frames are cut so one stack stays one readable line
+MAX_DEPTH = 64
+
+class SamplingProfiler:
+    def __init__(self):
+        self.interval = PROFILE_INTERVAL_MS / 1000.0
+        self.samples = Counter()
+        self.started = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=None, reset=True):
+        if interval_ms:
+            self.interval = interval_ms / 1000.0
+        if self.running:
+            return
+        if reset:
+            self.reset()
+        self._stop.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="shl-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.samples.values())
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "started": self.started,
+            "samples": total,
+        }
+
+    def collapsed(self, limit=None):
+        """Sampled stacks, most frequent first, as 'frame;frame;... count' lines."""
+        with self._lock:
+            stacks = self.samples.most_common(limit)
+        return "\n".join(f"{stack} {count}" for stack, count in stacks) + "\n"
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stacks.append(_collapse(names.get(ident, str(ident)), frame))
+            with self._lock:
+                self.samples.update(stacks)
+
+def _collapse(thread_name, frame):
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        code = frame.f_code
+        # Function-level frames (first line, not the current one) so samples aggregate
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+profiler = SamplingProfiler()
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+
+# Query preprocessing in front of search, so requests that only differ in form
+# share cached work:
+#
+#   normalize_query  Unicode (NFKC), case and whitespace folding, then stripping
+#                    request boilerplate ("I am hiring for", "give me some
+#                    options") and recurring JD taglines. The result keys the
+#                    query and result caches only; search encodes and matches
+#                    the folded text, so stripping never changes a ranking.
+#   RecentQueries    near-duplicates: the vectors of recently searched queries,
+#                    so a new query whose embedding is within DEDUP_THRESHOLD
+#                    cosine similarity of one of them reuses its results
+#                    without being searched.
+#
+# Set SHL_QUERY_NORMALIZE=0 to fold only case and whitespace, and
+# SHL_DEDUP_THRESHOLD=0 to turn off near-duplicate reuse.
+
+QUERY_NORMALIZE = os.environ.get("SHL_QUERY_NORMALIZE", "1") == "1"
+DEDUP_THRESHOLD = float(os.environ.get("SHL_DEDUP_THRESHOLD", "0.98"))
+# Recent query vectors kept per model for the near-duplicate lookup
+RECENT_QUERIES = int(os.environ.get("SHL_RECENT_QUERIES", "1024"))
+
+# Phrases that say how something is asked, not what is asked for. Matched on
+# folded text as whole words; numbers and skills are never part of them, so
+# duration constraints and search terms survive.
+BOILERPLATE = [
+    r"(?:hi|hello)[,!]?",
+    r"i am|i'm|we are|we're|i have",
+    r"(?:currently )?(?:hiring|looking) (?:for|to hire)",
+    r"i (?:want|need|would like) to hire",
+    r"(?:can|could) you (?:please )?(?:recommend|suggest)(?: me)?(?: some| an?)?(?: assessments?| options| tests?)?",
+    r"please",
+    r"(?:give|show|find|suggest|recommend) me(?: some| an?)?(?: assessments?| options| tests?)?",
+    r"based on the jd below",
+    r"for the jd below",
+    r"what options are available",
+    r"join a community that is shaping the future of work!?",
+    r"shl, people science\. people answers\.?",
+    r"people science\. people answers\.?",
+    r"thank you|thanks",
+]
+BOILERPLATE_RE = re.compile(r"(?<![\w'])(?:" + "|".join(BOILERPLATE) + r")(?![\w'])")
+# Punctuation left dangling at either end once a phrase is removed
+_DANGLING_RE = re.compile(r"^[\s,.;:!?-]+|[\s,;:!?-]+$")
+
+def fold(text):
+    """Case-, width- and whitespace-insensitive form of `text`."""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).lower().split())
+
+def normalize_query(text):
+    """Canonical text of a query, what cache keys are built from."""
+    folded = fold(text)
+    if not QUERY_NORMALIZE:
+        return folded
+    stripped, found = BOILERPLATE_RE.subn(" ", folded)
+    if not found:
+        return folded
+    stripped = _DANGLING_RE.sub("", " ".join(stripped.split()))
+    # A query that was nothing but boilerplate keeps its text
+    return stripped or folded
+
+def query_key(text):
+    """Short fixed-size hash of a normalized query, for cache keys (JD queries run to kilobytes)."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+class RecentQueries:
+    """
+    Ring buffer of the last `size` query vectors (L2-normalized, one model)
+    with the results served for them. Each entry carries a `group`, the rest
+    of the result-cache key (limit, filters, rerank options, catalog version),
+    and only entries of the same group can match.
+    """
+    def __init__(self, size=RECENT_QUERIES):
+        self.size = size
+        self._vectors = None
+        self._groups = [None] * size
+        self._hits = [None] * size
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+
+    def lookup(self, vector, group, threshold):
+        """Results of the most similar recent query of `group` at or above `threshold`, else None."""
+        with self._lock:
+            self.lookups += 1
+            if not self._count:
+                return None
+            sims = self._vectors[:self._count] @ vector
+            for slot in np.flatnonzero(sims >= threshold)[np.argsort(-sims[sims >= threshold])].tolist():
+                if self._groups[slot] == group:
+                    self.matches += 1
+                    return self._hits[slot]
+            return None
+
+    def add(self, vector, group, hits):
+        if self.size <= 0:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.size, len(vector)), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = vector
+            self._groups[slot] = group
+            self._hits[slot] = hits
+            self._next = (slot + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+
+    def clear(self):
+        with self._lock:
+            self._groups = [None] * self.size
+            self._hits = [None] * self.size
+            self._next = self._count = 0
+
+    def stats(self):
+        return {
+            "size": self._count,
+            "maxsize": self.size,
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "hit_rate": self.matches / self.lookups if self.lookups else 0.0,
+        }
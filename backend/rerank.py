@@ -0,0 +1,126 @@
+import os
+import re
+import numpy as np
+from catalog import TEST_TYPE_KEYS
+
+# Re-ranking of the candidate pool into the final results. All steps work on
+# positions into the pool and return a new order, so they chain:
+#
+#   mmr      Maximal Marginal Relevance over the candidate embeddings, trading
+#            relevance for novelty with `mmr_lambda` (1.0 = pure relevance)
+#   quotas   at most N results per SHL test type key (A, B, C, D, E, K, P, S)
+#   balance  the original Hard/Soft interleave for mixed-skill queries
+#
+# Options come per request as a dict: {"mmr_lambda": 0.7, "type_quotas": {"K": 4},
+# "balance": True}. Missing keys fall back to the defaults below.
+
+MMR_LAMBDA = float(os.environ["SHL_MMR_LAMBDA"]) if os.environ.get("SHL_MMR_LAMBDA") else None
+
+# Query wording that calls for Soft (behavioural/personality) assessments in the mix
+SOFT_INTENT_RE = re.compile(r"team|collaborat|communicat|lead|manag|person|behav|soft|interpersonal|cultur", re.IGNORECASE)
+
+# Best Hard and best Soft candidate scores closer than this are mixed even without soft intent
+COMPARABLE_SCORE_GAP = 0.15
+
+def rerank_key(options):
+    """Hashable form of rerank options, for cache keys and grouping."""
+    if not options:
+        return ()
+    return tuple(sorted(
+        (k, tuple(sorted(v.items())) if isinstance(v, dict) else v) for k, v in options.items() if v is not None
+    ))
+
+def mmr(embeddings, scores, lambda_, k=None):
+    """
+    Pool positions in MMR order: each step takes the candidate maximizing
+    lambda * score - (1 - lambda) * (max similarity to those already taken).
+    Only the first `k` are selected this way; the rest follow in pool order.
+    Similarities are computed against taken items only, k rows rather than
+    the pool's full n x n matrix.
+    """
+    n = len(scores)
+    k = n if k is None else min(k, n)
+    scores = np.asarray(scores, dtype=np.float32)
+    redundancy = np.zeros(n, dtype=np.float32)   # max similarity to the items taken so far
+    taken = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.intp)
+    for step in range(k):
+        gain = lambda_ * scores - (1 - lambda_) * redundancy
+        gain[taken] = -np.inf
+        best = int(np.argmax(gain))
+        order[step] = best
+        taken[best] = True
+        sims = embeddings @ embeddings[best]
+        redundancy = sims if step == 0 else np.maximum(redundancy, sims)
+    order[k:] = np.flatnonzero(~taken)
+    return order
+
+def apply_quotas(order, type_mask, quotas):
+    """
+    Keep `order` but drop candidates whose test types are already at their
+    quota. `type_mask` holds each pool item's SHL key bits; an item with
+    several keys counts towards each of them.
+    """
+    limits = [len(order)] * len(TEST_TYPE_KEYS)
+    for key, limit in quotas.items():
+        if str(key).upper() in TEST_TYPE_KEYS:
+            limits[TEST_TYPE_KEYS.index(str(key).upper())] = int(limit)
+
+    # Plain int bit tests: the pool is ~30 items, too small for array ops to pay off
+    counts = [0] * len(TEST_TYPE_KEYS)
+    full = sum(1 << i for i, limit in enumerate(limits) if limit <= 0)
+    keep = []
+    for pos, types in zip(order.tolist(), type_mask[order].tolist()):
+        if types & full:
+            continue
+        keep.append(pos)
+        for i in range(len(TEST_TYPE_KEYS)):
+            if types >> i & 1:
+                counts[i] += 1
+                if counts[i] >= limits[i]:
+                    full |= 1 << i
+    return np.array(keep, dtype=np.intp)
+
+def balance(order, hard, scores, query):
+    """
+    Interleave Hard and Soft candidates (by rank within each category) when the
+    query asks for soft skills or the best of each category score comparably.
+    Otherwise `order` is returned unchanged. With hybrid retrieval the pool is
+    in fused order, so each category's best score is its max, not its first.
+    """
+    hard = hard[order]
+    hard_pos = np.flatnonzero(hard)
+    soft_pos = np.flatnonzero(~hard)
+    if not len(hard_pos) or not len(soft_pos):
+        return order
+
+    score_gap = abs(float(scores[order[hard_pos]].max()) - float(scores[order[soft_pos]].max()))
+    if score_gap >= COMPARABLE_SCORE_GAP and not SOFT_INTENT_RE.search(query):
+        return order
+
+    # Hard, Soft, Hard, Soft, ... then the rest of whichever category is left
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[hard_pos] = 2 * np.arange(len(hard_pos))
+    rank[soft_pos] = 2 * np.arange(len(soft_pos)) + 1
+    return order[np.argsort(rank, kind="stable")]
+
+def rerank_pool(scores, query, limit, hard, type_mask, embeddings=None, options=None):
+    """
+    Positions of the final `limit` pool items, in order. `scores`, `hard`,
+    `type_mask` (and `embeddings`, a callable returning the pool's normalized
+    vectors, needed only for MMR) are parallel over the candidate pool.
+    """
+    options = options or {}
+    order = np.arange(len(scores))
+    if not len(order):
+        return order
+
+    lambda_ = options.get("mmr_lambda", MMR_LAMBDA)
+    if lambda_ is not None and lambda_ < 1.0 and embeddings is not None:
+        # Past the first `limit`, quota fill-ins follow in pool order
+        order = mmr(embeddings(), scores, float(lambda_), limit)
+    if options.get("type_quotas"):
+        order = apply_quotas(order, type_mask, options["type_quotas"])
+    if options.get("balance", True):
+        order = balance(order, hard, scores, query)
+    return order[:limit]
@@ -0,0 +1,104 @@
+import numpy as np
+
+# Storage types supported for the catalog matrix. float16 and int8 trade a
+# little precision for 2x / 4x less memory on large catalogs. float16 also
+# trades latency: NumPy widens it to float32 slowly, about 10x the float32 cost
+# per query (bench_scoring.py), while int8 stays close to float32.
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+# Rows converted back to float32 at a time when scoring a quantized matrix;
+# small enough that the widened block is still in cache when it is multiplied
+SCORE_CHUNK_ROWS = 1024
+
+def normalize_rows(matrix):
+    """L2-normalize rows so cosine similarity becomes a plain dot product."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k(scores, k):
+    """Indices of the k best scores along the last axis, best first."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    top_scores = np.take_along_axis(scores, top, axis=-1)
+    order = np.argsort(-top_scores, axis=-1)
+    return np.take_along_axis(top, order, axis=-1)
+
+class EmbeddingMatrix:
+    """
+    L2-normalized catalog embeddings in the dtype used for scoring.
+
+    float32 keeps the (possibly memory-mapped) array as is. float16 and int8
+    store a compact copy; int8 uses a symmetric per-row scale. Quantized rows
+    are widened to float32 in chunks while scoring, so BLAS is still used. The
+    widening is repeated for every score call (one per query, or per batch in
+    search_many); keeping a float32 copy would undo the memory saving.
+    """
+    def __init__(self, normalized, dtype="float32"):
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype {dtype!r}, expected one of {EMBEDDING_DTYPES}")
+
+        self.dtype = dtype
+        self.scale = None
+        if dtype == "float32":
+            self.data = normalized
+        elif dtype == "float16":
+            self.data = np.asarray(normalized, dtype=np.float16)
+        else:
+            normalized = np.asarray(normalized, dtype=np.float32)
+            scale = np.abs(normalized).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.data = np.round(normalized / scale[:, None]).astype(np.int8)
+            self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def from_arrays(cls, data, scale=None):
+        """Wrap already-converted storage (e.g. memory-mapped from a published snapshot) without copying."""
+        matrix = cls.__new__(cls)
+        matrix.dtype = data.dtype.name
+        matrix.data = data
+        matrix.scale = scale
+        return matrix
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def score(self, queries):
+        """
+        Dot product of normalized `queries` with every catalog row.
+        A 1-D query gives a 1-D score vector (GEMV); a 2-D batch gives (n_queries, n_items).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.dtype == "float32":
+            return self.data @ queries.T if queries.ndim == 1 else queries @ self.data.T
+
+        n = self.data.shape[0]
+        out = np.empty(queries.shape[:-1] + (n,), dtype=np.float32)
+        for start in range(0, n, SCORE_CHUNK_ROWS):
+            end = min(start + SCORE_CHUNK_ROWS, n)
+            block = self.data[start:end].astype(np.float32)
+            part = queries @ block.T
+            if self.scale is not None:
+                part *= self.scale[start:end]
+            out[..., start:end] = part
+        return out
+
+    def score_rows(self, query, rows):
+        """Dot product of one normalized query with the catalog rows listed in `rows`."""
+        block = np.asarray(self.data[rows], dtype=np.float32)
+        scores = block @ np.asarray(query, dtype=np.float32)
+        if self.scale is not None:
+            scores *= self.scale[rows]
+        return scores
+
+    def dense(self, rows=None):
+        """float32 copy of the normalized rows (all rows when `rows` is None)."""
+        block = self.data if rows is None else self.data[rows]
+        block = np.asarray(block, dtype=np.float32)
+        if self.scale is not None:
+            scale = self.scale if rows is None else self.scale[rows]
+            block = block * scale[:, None]
+        return block
@@ -1,72 +1,196 @@
+import argparse
+import hashlib
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
+import threading
 import time
 import re
 import json
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 BASE_URL = "https://www.shl.com/solutions/products/product-catalog/"
 OUTPUT_JSON = "d:/shl/data/assessments.json"
 OUTPUT_CSV = "d:/shl/data/assessments.csv"
+# Raw pages plus their ETag/Last-Modified, for conditional requests on the next run
+PAGE_CACHE_DIR = "d:/shl/data/page_cache"
+# Progress of an interrupted run; removed once a run completes
+CHECKPOINT_FILE = "d:/shl/data/scrape_checkpoint.json"
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124 Safari/537.36"
 }
 
-def fetch_assessment_details(assessment):
-    """Fetch details from the assessment's detail page."""
-    url = assessment["assessment_url"]
-    try:
-        response = requests.get(url, headers=HEADERS)
+MAX_WORKERS = 8
+# Global cap across all threads. Be nice to their server.
+REQUESTS_PER_SECOND = 4.0
+PAGE_SIZE = 12
+
+class RateLimiter:
+    """Spaces requests at least 1/rate seconds apart across all threads."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class Fetcher:
+    """
+    Pooled HTTP session with retries/backoff, a global rate limit and an
+    on-disk page cache. Pages seen before are requested conditionally
+    (If-None-Match / If-Modified-Since); a 304 is served from the cache.
+    """
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, rate=REQUESTS_PER_SECOND, workers=MAX_WORKERS):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = RateLimiter(rate)
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "errors": 0, "bytes": 0}
+
+    def _cache_paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".html"), os.path.join(self.cache_dir, key + ".json")
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def get(self, url, timeout=10):
+        """Return (status, content, cache_meta). cache_meta is the page's cache record, if any."""
+        body_path, meta_path = self._cache_paths(url)
+        meta = None
+        headers = {}
+        if os.path.exists(body_path) and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        self.limiter.wait()
+        self._count("requests")
+        response = self.session.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and meta is not None:
+            self._count("not_modified")
+            with open(body_path, "rb") as f:
+                return 200, f.read(), meta
+
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, "html.parser")
-            
-            description = None
-            duration_info = None
-            
-            product_module = soup.find("div", class_="product-catalogue module")
-            if not product_module:
-                product_module = soup.find("div", class_=lambda x: x and "product-catalogue" in x and "module" in x)
-            
-            if product_module:
-                # Find all rows with class "product-catalogue-training-calendar__row typ"
-                detail_rows = product_module.find_all("div", class_="product-catalogue-training-calendar__row typ")
+            self._count("bytes", len(response.content))
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            if meta["etag"] or meta["last_modified"]:
+                self._store(body_path, meta_path, response.content, meta)
+            else:
+                meta = None
+        return response.status_code, response.content, meta
+
+    def update_meta(self, url, meta):
+        """Attach extra fields (e.g. parsed details) to a cached page record."""
+        _, meta_path = self._cache_paths(url)
+        _write_json(meta_path, meta)
+
+    def _store(self, body_path, meta_path, content, meta):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{body_path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, body_path)
+        _write_json(meta_path, meta)
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def parse_assessment_details(content):
+    """Extract (description, duration) from a detail page."""
+    soup = BeautifulSoup(content, "html.parser")
+    
+    description = None
+    duration_info = None
+    
+    product_module = soup.find("div", class_="product-catalogue module")
+    if not product_module:
+        product_module = soup.find("div", class_=lambda x: x and "product-catalogue" in x and "module" in x)
+    
+    if product_module:
+        # Find all rows with class "product-catalogue-training-calendar__row typ"
+        detail_rows = product_module.find_all("div", class_="product-catalogue-training-calendar__row typ")
+        
+        # If no results, try finding by partial class match
+        if len(detail_rows) == 0:
+            detail_rows = product_module.find_all("div", class_=lambda x: x and "product-catalogue-training-calendar__row" in x)
+        
+        for row in detail_rows:
+            # Look for Description section
+            h4_tag = row.find("h4")
+            if h4_tag:
+                h4_text = h4_tag.text.strip()
                 
-                # If no results, try finding by partial class match
-                if len(detail_rows) == 0:
-                    detail_rows = product_module.find_all("div", class_=lambda x: x and "product-catalogue-training-calendar__row" in x)
+                # Extract description
+                if "description" in h4_text.lower():
+                    p_tag = row.find("p")
+                    if p_tag:
+                        description = p_tag.text.strip()
                 
-                for row in detail_rows:
-                    # Look for Description section
-                    h4_tag = row.find("h4")
-                    if h4_tag:
-                        h4_text = h4_tag.text.strip()
-                        
-                        # Extract description
-                        if "description" in h4_text.lower():
-                            p_tag = row.find("p")
-                            if p_tag:
-                                description = p_tag.text.strip()
-                        
-                        # Extract duration/assessment length
-                        elif "assessment length" in h4_text.lower():
-                            p_tag = row.find("p")
-                            if p_tag:
-                                p_text = p_tag.text.strip()
-                                 
-                                duration_match = re.search(r'=\s*(\d+)', p_text, re.IGNORECASE)
-                                if duration_match:
-                                    duration_info = f"{duration_match.group(1)} minutes"
-                                else:
-                                    duration_match = re.search(r'(\d+)\s*(?:min|minute|minutes)', p_text, re.IGNORECASE)
-                                    if duration_match:
-                                        duration_info = f"{duration_match.group(1)} minutes"
-                                    else:
-                                        num_match = re.search(r'(\d+)', p_text)
-                                        if num_match:
-                                            duration_info = f"{num_match.group(1)} minutes"
+                # Extract duration/assessment length
+                elif "assessment length" in h4_text.lower():
+                    p_tag = row.find("p")
+                    if p_tag:
+                        p_text = p_tag.text.strip()
+                         
+                        duration_match = re.search(r'=\s*(\d+)', p_text, re.IGNORECASE)
+                        if duration_match:
+                            duration_info = f"{duration_match.group(1)} minutes"
+                        else:
+                            duration_match = re.search(r'(\d+)\s*(?:min|minute|minutes)', p_text, re.IGNORECASE)
+                            if duration_match:
+                                duration_info = f"{duration_match.group(1)} minutes"
+                            else:
+                                num_match = re.search(r'(\d+)', p_text)
+                                if num_match:
+                                    duration_info = f"{num_match.group(1)} minutes"
+
+    return description, duration_info
+
+def fetch_assessment_details(assessment, fetcher):
+    """Fetch details from the assessment's detail page."""
+    url = assessment["assessment_url"]
+    try:
+        status, content, meta = fetcher.get(url)
+        if status == 200:
+            if meta is not None and "details" in meta:
+                # Page unchanged since the last run: reuse what we parsed then
+                description, duration_info = meta["details"]
+            else:
+                description, duration_info = parse_assessment_details(content)
+                if meta is not None:
+                    meta["details"] = [description, duration_info]
+                    fetcher.update_meta(url, meta)
             
             # Update the assessment object
             if description:
@@ -75,11 +199,12 @@ def fetch_assessment_details(assessment):
                 assessment["duration"] = duration_info
                 
     except Exception as e:
+        fetcher._count("errors")
         print(f"Error fetching details for {url}: {e}")
     
     return assessment
 
-def scrape_table(table):
+def scrape_table(table, site_url=BASE_URL):
     """Extract data from a single table."""
     assessments = []
     rows = table.find_all("tr")[1:]  # Skip header
@@ -95,7 +220,7 @@ def scrape_table(table):
         url = name_tag["href"] if name_tag and "href" in name_tag.attrs else ""
         
         # Ensure absolute URL
-        full_url = "https://www.shl.com" + url if url.startswith("/") else url
+        full_url = urljoin(site_url, url) if url else url
 
         # Check filtering (optional, based on previous logic, but user script didn't have it. keeping it broader is safer)
         # But we should probably filter out non-individual tests if that was important?
@@ -123,62 +248,104 @@ def scrape_table(table):
 
     return assessments
 
-def scrape_pages_for_assessments(type_param, max_pages):
-    all_assessments = []
-    # Scrape up to max_pages
-    for page_start in range(0, max_pages * 12, 12):
-        print(f"Fetching page start: {page_start}")
-        url = f"{BASE_URL}?start={page_start}&type={type_param}"
-        try:
-            response = requests.get(url, headers=HEADERS, timeout=10)
-            if response.status_code != 200:
-                print(f"Failed to fetch {url}: {response.status_code}")
-                break
-
-            soup = BeautifulSoup(response.content, "html.parser")
-
-            tables = soup.find_all("table")
-            
-            if len(tables) == 0:
-                print(f"No table found at start={page_start}, stopping.")
-                break
-            elif len(tables) == 1:
-                table = tables[0]
-            elif len(tables) >= 2:
-                table = tables[1]
-
-            assessments = scrape_table(table)
-            if not assessments:
-                print(f"No assessments found at start={page_start}, stopping.")
-                break
-            
-            print(f"Found {len(assessments)} assessments on this page.")
-            all_assessments.extend(assessments)
-            time.sleep(0.5)  # Be nice to their server
-            
-        except Exception as e:
-            print(f"Exception fetching {url}: {e}")
-            break
+def fetch_listing_page(fetcher, base_url, type_param, page_start):
+    """Assessments on one listing page; None when the listing has ended or failed."""
+    url = f"{base_url}?start={page_start}&type={type_param}"
+    try:
+        status, content, _ = fetcher.get(url)
+        if status != 200:
+            print(f"Failed to fetch {url}: {status}")
+            return None
+
+        soup = BeautifulSoup(content, "html.parser")
+
+        tables = soup.find_all("table")
+        
+        if len(tables) == 0:
+            print(f"No table found at start={page_start}, stopping.")
+            return None
+        elif len(tables) == 1:
+            table = tables[0]
+        elif len(tables) >= 2:
+            table = tables[1]
 
+        assessments = scrape_table(table, base_url)
+        if not assessments:
+            print(f"No assessments found at start={page_start}, stopping.")
+            return None
+        
+        print(f"Found {len(assessments)} assessments at start={page_start}.")
+        return assessments
+        
+    except Exception as e:
+        fetcher._count("errors")
+        print(f"Exception fetching {url}: {e}")
+        return None
+
+def scrape_pages_for_assessments(fetcher, type_param, max_pages, base_url=BASE_URL, workers=MAX_WORKERS):
+    """
+    Fetch listing pages concurrently, `workers` pages per wave, until a page
+    comes back empty. Pages are kept in order and cut at the first empty one.
+    """
+    all_assessments = []
+    starts = list(range(0, max_pages * PAGE_SIZE, PAGE_SIZE))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for wave in range(0, len(starts), workers):
+            wave_starts = starts[wave:wave + workers]
+            pages = list(executor.map(lambda start: fetch_listing_page(fetcher, base_url, type_param, start), wave_starts))
+            for page in pages:
+                if page is None:
+                    return all_assessments
+                all_assessments.extend(page)
     return all_assessments
 
-def scrape():
-    # Max pages 40 * 12 = 480 items, enough to cover target of ~377
-    assessments = scrape_pages_for_assessments(type_param=1, max_pages=40)
+def load_checkpoint(path, base_url):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return checkpoint if checkpoint.get("base_url") == base_url else None
+
+def save_checkpoint(path, base_url, assessments, done):
+    _write_json(path, {"base_url": base_url, "assessments": assessments, "done": sorted(done)})
+
+def scrape(base_url=BASE_URL, max_pages=40, fetcher=None, checkpoint_file=CHECKPOINT_FILE, workers=MAX_WORKERS):
+    fetcher = fetcher or Fetcher(workers=workers)
+    checkpoint = load_checkpoint(checkpoint_file, base_url) if checkpoint_file else None
+
+    if checkpoint:
+        assessments = checkpoint["assessments"]
+        done = set(checkpoint["done"])
+        print(f"Resuming from checkpoint: {len(done)}/{len(assessments)} details already fetched")
+    else:
+        # Max pages 40 * 12 = 480 items, enough to cover target of ~377
+        assessments = scrape_pages_for_assessments(fetcher, type_param=1, max_pages=max_pages, base_url=base_url, workers=workers)
+        done = set()
+        if checkpoint_file:
+            save_checkpoint(checkpoint_file, base_url, assessments, done)
     
-    print(f"Start fetching details for {len(assessments)} items...")
+    pending = [a for a in assessments if a["assessment_url"] not in done]
+    print(f"Start fetching details for {len(pending)} items...")
     
     # Use ThreadPoolExecutor to fetch details in parallel
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        future_to_assessment = {executor.submit(fetch_assessment_details, assessment): assessment 
-                               for assessment in assessments}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        future_to_assessment = {executor.submit(fetch_assessment_details, assessment, fetcher): assessment 
+                               for assessment in pending}
         
         completed = 0
         for future in as_completed(future_to_assessment):
+            done.add(future_to_assessment[future]["assessment_url"])
             completed += 1
             if completed % 10 == 0:
-                print(f"Progress: {completed}/{len(assessments)} details processed")
+                print(f"Progress: {completed}/{len(pending)} details processed")
+                if checkpoint_file:
+                    save_checkpoint(checkpoint_file, base_url, assessments, done)
     
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
     return assessments
 
 def save_data(assessments):
@@ -197,5 +364,22 @@ def save_data(assessments):
         print("No data to save to CSV")
 
 if __name__ == "__main__":
-    data = scrape()
+    parser = argparse.ArgumentParser(description="Scrape the SHL product catalog")
+    parser.add_argument("--base-url", default=BASE_URL, help="Catalog listing URL (e.g. a local fixture server)")
+    parser.add_argument("--max-pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="Max requests per second")
+    parser.add_argument("--cache-dir", default=PAGE_CACHE_DIR)
+    parser.add_argument("--fresh", action="store_true", help="Ignore any checkpoint from an interrupted run")
+    args = parser.parse_args()
+
+    if args.fresh and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+    start = time.perf_counter()
+    fetcher = Fetcher(cache_dir=args.cache_dir, rate=args.rate, workers=args.workers)
+    data = scrape(args.base_url, args.max_pages, fetcher, workers=args.workers)
     save_data(data)
+    print(f"Wall clock: {time.perf_counter() - start:.1f} s")
+    print(f"Requests: {fetcher.stats['requests']} ({fetcher.stats['not_modified']} not modified, "
+          f"{fetcher.stats['errors']} errors, {fetcher.stats['bytes'] / 1e6:.1f} MB downloaded)")
@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import scrape
+
+# Offline check of scrape.py against saved catalog pages (data/fixtures/scrape/)
+# served by a local HTTP server. The scraper runs twice with one page cache:
+# the first run downloads every page, the second should get a 304 for each of
+# them. Reports wall clock and request, 304 and error counts of both runs and
+# exits non-zero when they are not what the fixture implies.
+#
+# The fixture: listing pages for start=0 (12 items) and start=12 (3 items),
+# an empty listing for any later start, and detail pages for all items but
+# the last, which the server answers with 500 (one error per run, after the
+# session's retries).
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "fixtures", "scrape")
+LISTING_PATH = "/solutions/products/product-catalog/"
+DETAIL_PREFIX = "/products/product-catalog/view/"
+# Fixed so Last-Modified is stable between runs
+LAST_MODIFIED = formatdate(1735689600, usegmt=True)
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Saved pages with an ETag and Last-Modified; conditional requests get 304."""
+    hits = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _page(self):
+        url = urlsplit(self.path)
+        if url.path == LISTING_PATH:
+            start = parse_qs(url.query).get("start", ["0"])[0]
+            path = os.path.join(FIXTURE_DIR, f"listing_{start}.html")
+            return path if os.path.exists(path) else os.path.join(FIXTURE_DIR, "listing_end.html")
+        if url.path.startswith(DETAIL_PREFIX):
+            path = os.path.join(FIXTURE_DIR, "detail", url.path[len(DETAIL_PREFIX):].strip("/") + ".html")
+            return path if os.path.exists(path) else None
+        return None
+
+    def do_GET(self):
+        path = self._page()
+        if path is None:
+            return self._reply(500)
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304)
+        self._reply(200, body, {"ETag": etag, "Last-Modified": LAST_MODIFIED, "Content-Type": "text/html; charset=utf-8"})
+
+    def _reply(self, status, body=b"", headers=None):
+        with self.lock:
+            self.hits[status] = self.hits.get(status, 0) + 1
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def run(base_url, cache_dir, workers, rate):
+    FixtureHandler.hits = {}
+    fetcher = scrape.Fetcher(cache_dir=cache_dir, rate=rate, workers=workers)
+    start = time.perf_counter()
+    assessments = scrape.scrape(base_url, max_pages=40, fetcher=fetcher, checkpoint_file=None, workers=workers)
+    return {
+        "seconds": time.perf_counter() - start,
+        "assessments": assessments,
+        "server": dict(FixtureHandler.hits),
+        **fetcher.stats,
+    }
+
+def check(workers=scrape.MAX_WORKERS, rate=scrape.REQUESTS_PER_SECOND):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}{LISTING_PATH}"
+    cache_dir = tempfile.mkdtemp(prefix="shl-scrape-")
+    try:
+        first = run(base_url, cache_dir, workers, rate)
+        second = run(base_url, cache_dir, workers, rate)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # Listing pages are fetched in waves of `workers` up to the wave holding the
+    # first empty page (the third), then one detail page per item
+    items = len(first["assessments"])
+    expected_requests = -(-3 // workers) * workers + items
+    failures = []
+    if items != 15:
+        failures.append(f"expected 15 assessments, got {items}")
+    for name, result in (("first", first), ("second", second)):
+        if result["requests"] != expected_requests:
+            failures.append(f"{name} run: {result['requests']} requests, expected {expected_requests}")
+        if result["errors"] != 1:
+            failures.append(f"{name} run: {result['errors']} errors, expected 1 (the page answered with 500)")
+    if first["not_modified"] != 0:
+        failures.append(f"first run: {first['not_modified']} not modified, expected 0")
+    if second["not_modified"] != expected_requests - 1:
+        failures.append(f"second run: {second['not_modified']} not modified, expected {expected_requests - 1}")
+    if second["bytes"] != 0:
+        failures.append(f"second run downloaded {second['bytes']} bytes, expected 0")
+    if second["assessments"] != first["assessments"]:
+        failures.append("second run parsed different assessments")
+    with_details = sum(a["description"] != "N/A" and a["duration"] != "N/A" for a in first["assessments"])
+    if with_details != items - 1:
+        failures.append(f"{with_details} assessments with description and duration, expected {items - 1}")
+
+    print(f"\n{'run':<7} {'wall s':>7} {'requests':>9} {'304':>5} {'errors':>7} {'KB':>7}  server responses")
+    for name, result in (("first", first), ("second", second)):
+        server_hits = ", ".join(f"{status}: {n}" for status, n in sorted(result["server"].items()))
+        print(f"{name:<7} {result['seconds']:>7.2f} {result['requests']:>9} {result['not_modified']:>5} "
+              f"{result['errors']:>7} {result['bytes'] / 1024:>7.1f}  {server_hits}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return not failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scrape.py twice against a local server of saved catalog pages")
+    parser.add_argument("--workers", type=int, default=scrape.MAX_WORKERS)
+    parser.add_argument("--rate", type=float, default=scrape.REQUESTS_PER_SECOND, help="Max requests per second")
+    args = parser.parse_args()
+    sys.exit(0 if check(args.workers, args.rate) else 1)
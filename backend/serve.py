@@ -0,0 +1,57 @@
+import argparse
+import os
+import threading
+import time
+import uvicorn
+import engine as E
+from shared_snapshot import publish
+
+# Multi-process serving. This process loads the catalog and encodes it once,
+# publishes the snapshot for memory-mapping (shared_snapshot.py), then runs N
+# uvicorn workers of main:app that attach to it. Each worker loads only the
+# query encoder, so adding workers adds one model copy rather than one full
+# engine. With SHL_WATCH_CATALOG=1 the catalog is reloaded and republished here
+# and the workers pick up the new version on their own.
+
+def watch_catalog(engine, directory, interval):
+    last = os.stat(E.DATA_FILE).st_mtime_ns
+    while True:
+        time.sleep(interval)
+        try:
+            current = os.stat(E.DATA_FILE).st_mtime_ns
+            if current == last:
+                continue
+            last = current
+            engine.reload_data()
+            publish(engine.snapshot, directory, engine.model_id)
+        except Exception as e:
+            print(f"Error: catalog reload failed: {e}")
+
+def main(args):
+    directory = args.shared_dir or os.path.join(E.CACHE_DIR, "shared")
+    engine = E.RecommendationEngine()
+    if engine.state != "ready" or not engine.assessments:
+        raise SystemExit("Engine failed to load; nothing to serve.")
+    path = publish(engine.snapshot, directory, engine.model_id)
+    print(f"Published snapshot to {path}")
+
+    watch = os.environ.get("SHL_WATCH_CATALOG", "0") == "1"
+    if watch:
+        interval = float(os.environ.get("SHL_WATCH_INTERVAL", "2"))
+        threading.Thread(target=watch_catalog, args=(engine, directory, interval), daemon=True).start()
+    else:
+        # Nothing left to do here; don't keep a model copy in the supervisor
+        del engine
+
+    # Workers are spawned fresh and find the snapshot through the environment
+    os.environ["SHL_SHARED_SNAPSHOT"] = directory
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                app_dir=os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API with several workers sharing one loaded catalog")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--shared-dir", help="where to publish the snapshot (default: data/cache/shared)")
+    main(parser.parse_args())
@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+from bm25 import BM25Index
+from catalog import CatalogColumns
+from index import ExactIndex, IVFIndex
+from scoring import EmbeddingMatrix
+
+# Publishing a loaded catalog snapshot for multi-process serving.
+#
+# The parent process writes every array the search path reads (scoring matrix,
+# catalog columns, BM25 postings, IVF lists) as .npy files, plus the assessment
+# records and response fragments as blobs with row offsets. Workers memory-map them read-only,
+# so all processes share one copy through the page cache and a worker only
+# holds its query encoder and small per-process caches.
+#
+# Each publish goes to a new version directory; `current.json` names the live
+# one and is replaced atomically, so workers can poll it and re-attach.
+
+POINTER = "current.json"
+KEEP_VERSIONS = 2
+# CatalogColumns arrays, in from_arrays order
+COLUMNS = ("duration", "type_mask", "remote", "adaptive", "hard")
+
+class SharedBlobs:
+    """Read-only sequence of byte strings sliced on access from one mapped blob."""
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.blob[start:end].tobytes()
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+class SharedRecords(SharedBlobs):
+    """Read-only sequence of assessment dicts decoded on access from a mapped JSON blob."""
+    def __getitem__(self, row):
+        return json.loads(super().__getitem__(row))
+
+def _save(directory, name, array):
+    np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+def _load(directory, name):
+    return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+def _save_blobs(directory, name, blobs):
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(blobs))
+    _save(directory, f"{name}_offsets", offsets)
+
+def _load_blobs(directory, name, cls=SharedBlobs):
+    path = os.path.join(directory, f"{name}.bin")
+    # np.memmap refuses to map an empty file
+    blob = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+    return cls(blob, _load(directory, f"{name}_offsets"))
+
+def publish(snapshot, directory, model_id):
+    """Write `snapshot` under `directory` and make it the current published version. Returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"v{time.time_ns()}"
+    tmp = os.path.join(directory, f"{name}.{os.getpid()}.tmp")
+    os.makedirs(tmp)
+
+    records = [json.dumps(item, ensure_ascii=False).encode("utf-8") for item in snapshot.assessments]
+    _save_blobs(tmp, "records", records)
+
+    matrix = snapshot.embedding_matrix
+    _save(tmp, "matrix", matrix.data)
+    if matrix.scale is not None:
+        _save(tmp, "matrix_scale", matrix.scale)
+
+    columns = snapshot.columns
+    for column in COLUMNS:
+        _save(tmp, column, getattr(columns, column))
+    _save_blobs(tmp, "fragments", list(columns.fragments))
+
+    manifest = {
+        "model_id": model_id,
+        "data_hash": snapshot.data_hash,
+        "count": len(records),
+        "index": snapshot.index.name,
+        "hybrid": snapshot.bm25 is not None,
+    }
+    if snapshot.bm25 is not None:
+        bm25 = snapshot.bm25
+        _save(tmp, "bm25_indptr", bm25.indptr)
+        _save(tmp, "bm25_doc_ids", bm25.doc_ids)
+        _save(tmp, "bm25_weights", bm25.weights)
+        with open(os.path.join(tmp, "bm25_vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(bm25.vocab, f, ensure_ascii=False)
+    if isinstance(snapshot.index, IVFIndex):
+        _save(tmp, "ivf_centroids", snapshot.index.centroids)
+        _save(tmp, "ivf_list_offsets", snapshot.index.list_offsets)
+        _save(tmp, "ivf_list_rows", snapshot.index.list_rows)
+        manifest["n_probe"] = snapshot.index.n_probe
+
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    path = os.path.join(directory, name)
+    os.replace(tmp, path)
+
+    pointer_tmp = os.path.join(directory, f"{POINTER}.{os.getpid()}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": name}, f)
+    os.replace(pointer_tmp, os.path.join(directory, POINTER))
+    _prune(directory, keep=name)
+    return path
+
+def _prune(directory, keep):
+    versions = sorted(d for d in os.listdir(directory) if d.startswith("v") and not d.endswith(".tmp"))
+    for old in versions[:-KEEP_VERSIONS]:
+        if old != keep:
+            # Workers still mapping these files keep them alive until they re-attach
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+def current_version(directory):
+    """Name of the live published version, or None when nothing has been published."""
+    try:
+        with open(os.path.join(directory, POINTER), "r", encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def attach(directory, version=None):
+    """
+    Map the published snapshot (the current one unless `version` is given).
+    Returns (version, manifest, fields) where `fields` are CatalogSnapshot
+    keyword arguments sharing the published arrays without copying.
+    """
+    version = version or current_version(directory)
+    if version is None:
+        raise FileNotFoundError(f"No published snapshot in {directory}")
+    path = os.path.join(directory, version)
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    assessments = _load_blobs(path, "records", SharedRecords)
+
+    scale_file = os.path.join(path, "matrix_scale.npy")
+    matrix = EmbeddingMatrix.from_arrays(
+        _load(path, "matrix"), np.load(scale_file, mmap_mode="r") if os.path.exists(scale_file) else None
+    )
+    columns = CatalogColumns.from_arrays(*(_load(path, c) for c in COLUMNS), _load_blobs(path, "fragments"))
+
+    bm25 = None
+    if manifest["hybrid"]:
+        with open(os.path.join(path, "bm25_vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        bm25 = BM25Index.from_arrays(
+            vocab, _load(path, "bm25_indptr"), _load(path, "bm25_doc_ids"), _load(path, "bm25_weights"),
+            manifest["count"],
+        )
+
+    if manifest["index"] == "ivf":
+        index = IVFIndex(matrix, n_probe=manifest["n_probe"])
+        index.centroids = _load(path, "ivf_centroids")
+        index.list_offsets = _load(path, "ivf_list_offsets")
+        index.list_rows = _load(path, "ivf_list_rows")
+        index.n_lists = len(index.centroids)
+    else:
+        index = ExactIndex(matrix)
+
+    fields = {
+        "assessments": assessments,
+        "columns": columns,
+        # The raw float32 embeddings are only published when they are the scoring matrix
+        "embeddings": matrix.data if matrix.scale is None and matrix.dtype == "float32" else None,
+        "embedding_matrix": matrix,
+        "index": index,
+        "bm25": bm25,
+        "data_hash": manifest["data_hash"],
+    }
+    return version, manifest, fields
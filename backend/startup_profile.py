@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Measures API startup: the slowest imports of main.py (python -X importtime),
+# time until uvicorn accepts connections, and time until /health reports ready.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def import_profile(top):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m:
+            rows.append((int(m.group(2)), len(m.group(3)), m.group(4)))
+    total = max((r[0] for r in rows), default=0)
+    print(f"Import of main.py: {total / 1000:.1f} ms")
+    print(f"{'cumulative ms':>14}  module")
+    for cumulative, _, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>14.1f}  {module}")
+    heavy = [m for _, _, m in rows if m.split(".")[0] in ("torch", "sentence_transformers", "transformers")]
+    print(f"torch/sentence-transformers imported: {'yes' if heavy else 'no'}")
+
+def wait_for_port(port, deadline):
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+def serve_profile(port, timeout):
+    start = time.monotonic()
+    deadline = start + timeout
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        if not wait_for_port(port, deadline):
+            print("Server did not bind the port in time")
+            return
+        print(f"Port bound after: {time.monotonic() - start:.2f} s")
+
+        while time.monotonic() < deadline:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health") as resp:
+                status = json.load(resp)["status"]
+            if status in ("ready", "error"):
+                print(f"Engine {status} after: {time.monotonic() - start:.2f} s")
+                return
+            time.sleep(0.1)
+        print("Engine did not become ready in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile API startup time")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+    import_profile(args.top)
+    serve_profile(args.port, args.timeout)
@@ -0,0 +1,24 @@
+import time
+from contextlib import contextmanager
+
+# Per-stage wall-clock timing for search. Callers pass a dict and each timed
+# block adds its seconds under the stage name; with None nothing is measured.
+
+STAGES = ("encode", "score", "topk", "fuse", "cross", "rerank")
+
+@contextmanager
+def stage(timings, name):
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def merge_timings(total, timings):
+    """Add the stage seconds in `timings` into `total`."""
+    for name, seconds in timings.items():
+        total[name] = total.get(name, 0.0) + seconds
+    return total